@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import operator
+import re
+import struct
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src",
+    "cmpid", "ocid", "smid", "sr_share", "taid", "mod", "rss", "feedtype", "outputtype", "amp",
+}
+TRACKING_PREFIXES = ("utm_", "at_", "itm_")
+
+_WORD = re.compile(r"[a-z0-9]+")
+# An "amp" path segment anywhere: /amp/news/x, /news/amp/x, /news/x/amp
+_AMP_SEGMENT = re.compile(r"/amp(?=/|$)")
+_QUERY_TERM = re.compile(r'"([^"]+)"|([A-Za-z0-9.&\-]+)')
+
+
+def canonicalize_url(url: str) -> str:
+    # Same story reached through tracking links, AMP pages or http/www variants maps to one key
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.startswith("amp."):
+        host = host[4:]
+    path = parts.path
+    path = _AMP_SEGMENT.sub("", path)
+    path = re.sub(r"\.amp(\.html?)?$", r"\1", path)
+    path = path.rstrip("/") or "/"
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+def normalize_title(title: str) -> str:
+    return " ".join(_WORD.findall(title.lower()))
+
+
+def query_terms(query: str) -> List[str]:
+    # "(oil OR gas OR \"power grid\")" -> ["oil", "gas", "power grid"]
+    terms: List[str] = []
+    for phrase, word in _QUERY_TERM.findall(query):
+        term = (phrase or word).strip().lower()
+        if term and term not in {"or", "and", "not"}:
+            terms.append(normalize_title(term))
+    return [t for t in terms if t]
+
+
+def parse_published(value: str) -> datetime | None:
+    if not value:
+        return None
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+class MinHasher:
+    # MinHash signatures over character shingles, bucketed by LSH bands so near-duplicate
+    # candidates are found without comparing every pair. One 64-byte blake2b digest per
+    # shingle supplies all 32 16-bit hash functions at once.
+
+    num_perm = 32
+    _unpack = struct.Struct("<32H").unpack
+
+    def __init__(self, bands: int = 16, shingle: int = 5) -> None:
+        if self.num_perm % bands:
+            raise ValueError("bands must divide 32")
+        self.bands = bands
+        self.rows = self.num_perm // bands
+        self.shingle = shingle
+
+    def _shingles(self, text: str) -> set:
+        if len(text) <= self.shingle:
+            return {text}
+        return {text[i : i + self.shingle] for i in range(len(text) - self.shingle + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        rows = [self._unpack(hashlib.blake2b(s.encode("utf-8"), digest_size=64).digest()) for s in self._shingles(text)]
+        return tuple(map(min, zip(*rows)))
+
+    def band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(band, signature[band * self.rows : (band + 1) * self.rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        return sum(map(operator.eq, a, b)) / len(a)
+
+
+class ArticleIndex:
+    # Collects articles from every feed/query, collapses duplicates (canonical URL, then
+    # near-identical titles), scores them by recency and category relevance, and picks the
+    # top N per category with each story used at most once.
+
+    def __init__(
+        self,
+        queries: Dict[str, str] | None = None,
+        *,
+        threshold: float = 0.6,
+        half_life_hours: float = 12.0,
+        recency_weight: float = 0.6,
+        relevance_weight: float = 0.4,
+        now: datetime | None = None,
+    ) -> None:
+        self.terms = {category: query_terms(q) for category, q in (queries or {}).items()}
+        self.threshold = threshold
+        self.half_life_hours = half_life_hours
+        self.recency_weight = recency_weight
+        self.relevance_weight = relevance_weight
+        self.now = now or datetime.now(timezone.utc)
+        self.hasher = MinHasher()
+
+        self.articles: List[dict] = []
+        self._categories: List[set] = []
+        self._signatures: List[Tuple[int, ...]] = []
+        self._by_url: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+        self._parent: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    def _find(self, i: int) -> int:
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def _union(self, a: int, b: int) -> None:
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            self._parent[rb] = ra
+
+    def add(self, category: str, articles: Iterable[dict]) -> None:
+        for article in articles:
+            self._add_one(category, article)
+
+    def _add_one(self, category: str, article: dict) -> None:
+        url = canonicalize_url(article.get("link") or "")
+        if url and url in self._by_url:
+            self._categories[self._by_url[url]].add(category)
+            return
+
+        idx = len(self.articles)
+        self.articles.append(article)
+        self._categories.append({category})
+        self._parent.append(idx)
+        if url:
+            self._by_url[url] = idx
+
+        title = normalize_title(article.get("title") or "")
+        signature = self.hasher.signature(title) if title and title != "untitled" else ()
+        self._signatures.append(signature)
+        if not signature:
+            return
+        # Each bucket remembers its first member only, so every article is compared against
+        # at most `bands` others.
+        others = {self._buckets.setdefault(key, idx) for key in self.hasher.band_keys(signature)}
+        others.discard(idx)
+        for other in others:
+            if self.hasher.similarity(signature, self._signatures[other]) >= self.threshold:
+                self._union(other, idx)
+
+    def recency(self, article: dict) -> float:
+        published = parse_published(article.get("published") or "")
+        if published is None:
+            return 0.0
+        age_hours = max(0.0, (self.now - published).total_seconds() / 3600)
+        return math.pow(0.5, age_hours / self.half_life_hours)
+
+    def relevance(self, article: dict, category: str) -> float:
+        terms = self.terms.get(category)
+        if not terms:
+            return 0.0
+        text = f" {normalize_title(article.get('title') or '')} "
+        matched = sum(1 for t in terms if f" {t} " in text)
+        return min(1.0, matched / 2)
+
+    def score(self, article: dict, category: str) -> float:
+        return self.recency_weight * self.recency(article) + self.relevance_weight * self.relevance(article, category)
+
+    def select(self, per_category: int, categories: Iterable[str] | None = None) -> Dict[str, List[dict]]:
+        order = list(categories) if categories is not None else list(self.terms)
+        clusters: Dict[int, List[int]] = {}
+        for i in range(len(self.articles)):
+            clusters.setdefault(self._find(i), []).append(i)
+
+        recency = [self.recency(a) for a in self.articles]
+
+        def score(i: int, category: str) -> float:
+            return self.recency_weight * recency[i] + self.relevance_weight * self.relevance(self.articles[i], category)
+
+        # One candidate per (cluster, category it appeared in), using the cluster's best member
+        candidates: List[Tuple[float, int, int, str]] = []
+        for root, members in clusters.items():
+            seen_in = set().union(*(self._categories[i] for i in members))
+            for category in seen_in:
+                best = max(members, key=lambda i: (score(i, category), -i))
+                candidates.append((score(best, category), -best, root, category))
+        candidates.sort(reverse=True)
+
+        selected: Dict[str, List[Tuple[int, dict]]] = {c: [] for c in order}
+        used = set()
+        for _, neg_idx, root, category in candidates:
+            if root in used or category not in selected or len(selected[category]) >= per_category:
+                continue
+            used.add(root)
+            selected[category].append((-neg_idx, self.articles[-neg_idx]))
+        return {c: [a for _, a in items] for c, items in selected.items()}
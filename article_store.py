@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from article_index import canonicalize_url, parse_published, query_terms
+from env import get_float
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    link TEXT NOT NULL,
+    source TEXT,
+    published TEXT NOT NULL,
+    published_ts REAL NOT NULL,
+    first_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_published ON articles (published_ts);
+CREATE TABLE IF NOT EXISTS article_categories (
+    category TEXT NOT NULL,
+    article_id INTEGER NOT NULL,
+    PRIMARY KEY (category, article_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS article_categories_article ON article_categories (article_id);
+CREATE TABLE IF NOT EXISTS fetch_state (
+    source TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+"""
+
+# Title index kept in sync with `articles` by triggers (external-content FTS5 table)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, content='articles', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+"""
+
+_COLUMNS = "a.id, a.title, a.link, a.source, a.published"
+
+
+def _fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def article_key(article: dict) -> Optional[str]:
+    # Canonical URL first, so the same story from two feeds is stored once; GUID otherwise
+    link = (article.get("link") or "").strip()
+    if link:
+        return canonicalize_url(link)
+    guid = (article.get("guid") or "").strip()
+    return f"guid:{guid}" if guid else None
+
+
+def fts_query(query: str) -> str:
+    # "(oil OR gas OR \"power grid\")" -> '"oil" OR "gas" OR "power grid"'
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in query_terms(query))
+
+
+class ArticleStore:
+    # Articles seen across runs, keyed by canonical URL/GUID. Each run ingests only what is
+    # new; category context is read back with indexed queries over a time window (category
+    # tags plus an FTS5 title search on the category's query terms), and rows older than the
+    # retention window are pruned.
+
+    def __init__(self, path: str | os.PathLike | None = None, retention_days: float | None = None) -> None:
+        self.path = Path(path or os.getenv("ARTICLE_STORE_PATH", ".cache/articles.sqlite3"))
+        self.retention_days = retention_days or get_float("ARTICLE_STORE_RETENTION_DAYS", 7.0)
+        self.fts = _fts5_available()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            if self.fts:
+                conn.executescript(FTS_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ingest(self, category: str, articles: Iterable[dict], now: float | None = None) -> int:
+        # Returns how many articles were new to the store
+        now = now or time.time()
+        new = 0
+        with self._connect() as conn:
+            for article in articles:
+                key = article_key(article)
+                if key is None:
+                    continue
+                published = article.get("published") or ""
+                dt = parse_published(published)
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO articles (key, title, link, source, published, published_ts, first_seen)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        article.get("title") or "Untitled",
+                        article.get("link") or "",
+                        article.get("source"),
+                        published,
+                        dt.timestamp() if dt is not None else now,
+                        now,
+                    ),
+                )
+                if cur.rowcount:
+                    new += 1
+                    article_id = cur.lastrowid
+                else:
+                    article_id = conn.execute("SELECT id FROM articles WHERE key = ?", (key,)).fetchone()[0]
+                conn.execute(
+                    "INSERT OR IGNORE INTO article_categories (category, article_id) VALUES (?, ?)",
+                    (category, article_id),
+                )
+        return new
+
+    def candidates(self, category: str, query: str, since: float, limit: int) -> List[dict]:
+        # Newest articles tagged with the category, plus the best title matches for its query
+        # terms from any category, all published after `since`.
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM article_categories c JOIN articles a ON a.id = c.article_id"
+                " WHERE c.category = ? AND a.published_ts >= ? ORDER BY a.published_ts DESC LIMIT ?",
+                (category, since, limit),
+            ).fetchall()
+            match = fts_query(query) if self.fts else ""
+            if match:
+                rows += conn.execute(
+                    f"SELECT {_COLUMNS} FROM articles_fts f JOIN articles a ON a.id = f.rowid"
+                    " WHERE articles_fts MATCH ? AND a.published_ts >= ? ORDER BY bm25(articles_fts) LIMIT ?",
+                    (match, since, limit),
+                ).fetchall()
+        seen = set()
+        out: List[dict] = []
+        for row in rows:
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            article = {"title": row["title"], "link": row["link"], "published": row["published"]}
+            if row["source"]:
+                article["source"] = row["source"]
+            out.append(article)
+        return out
+
+    def watermark(self, source: str) -> Optional[float]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT fetched_at FROM fetch_state WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermarks(self, fetched_at: Dict[str, float]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO fetch_state (source, fetched_at) VALUES (?, ?)"
+                " ON CONFLICT (source) DO UPDATE SET fetched_at = excluded.fetched_at",
+                list(fetched_at.items()),
+            )
+
+    def prune(self, now: float | None = None) -> int:
+        # Drop articles older than the retention window (by publish time, or first sighting
+        # for undated ones) and compact the title index afterwards.
+        cutoff = (now or time.time()) - self.retention_days * 86400
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM article_categories WHERE article_id IN (SELECT id FROM articles WHERE published_ts < ?)",
+                (cutoff,),
+            )
+            removed = conn.execute("DELETE FROM articles WHERE published_ts < ?", (cutoff,)).rowcount
+            if removed and self.fts:
+                conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+        return removed
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
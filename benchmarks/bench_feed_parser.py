@@ -0,0 +1,116 @@
+"""Compare the streaming feed parser against full feedparser.parse.
+
+Usage:
+    python benchmarks/bench_feed_parser.py [--fixtures DIR] [--limit 8] [--repeat 20]
+
+Without --fixtures, synthetic RSS and Atom documents shaped like the large feeds we pull
+(many entries, long HTML bodies) are used. Record real ones with e.g.
+``curl -o ars.xml https://feeds.arstechnica.com/arstechnica/index``.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from feed_parser import parse_feed, parse_with_feedparser  # noqa: E402
+
+CHUNK_SIZE = 16384
+
+
+def synthetic_rss(items: int = 60, body_chars: int = 8000) -> bytes:
+    body = ("<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8 + "</p>") * (body_chars // 480)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">',
+        "<channel><title>Synthetic RSS</title><link>https://example.com/</link>",
+    ]
+    for i in range(items):
+        parts.append(
+            f"<item><title>Story {i}: markets move on data</title>"
+            f"<link>https://example.com/story/{i}</link>"
+            f"<pubDate>Mon, 06 Jan 2025 {i % 24:02d}:00:00 GMT</pubDate>"
+            f"<description><![CDATA[{body[:400]}]]></description>"
+            f"<content:encoded><![CDATA[{body}]]></content:encoded></item>"
+        )
+    parts.append("</channel></rss>")
+    return "".join(parts).encode("utf-8")
+
+
+def synthetic_atom(entries: int = 60, body_chars: int = 8000) -> bytes:
+    body = ("&lt;p&gt;" + "Sed ut perspiciatis unde omnis iste natus error. " * 8 + "&lt;/p&gt;") * (body_chars // 440)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<feed xmlns="http://www.w3.org/2005/Atom"><title>Synthetic Atom</title>',
+    ]
+    for i in range(entries):
+        parts.append(
+            f"<entry><title>Entry {i}</title>"
+            f'<link rel="alternate" href="https://example.com/entry/{i}"/>'
+            f"<updated>2025-01-06T{i % 24:02d}:00:00Z</updated>"
+            f'<content type="html">{body}</content></entry>'
+        )
+    parts.append("</feed>")
+    return "".join(parts).encode("utf-8")
+
+
+def load_fixtures(directory: str | None) -> Dict[str, bytes]:
+    if not directory:
+        return {"synthetic-rss": synthetic_rss(), "synthetic-atom": synthetic_atom()}
+    return {p.name: p.read_bytes() for p in sorted(Path(directory).glob("*.xml"))}
+
+
+def _chunks(data: bytes):
+    buf = io.BytesIO(data)
+    while True:
+        chunk = buf.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def measure(fn: Callable[[], List[dict]], repeat: int) -> dict:
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    cpu_ms = (time.process_time() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    entries = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": round(cpu_ms, 3), "peak_kib": round(peak / 1024, 1), "entries": len(entries)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streaming vs feedparser benchmark")
+    parser.add_argument("--fixtures", help="Directory of recorded *.xml feeds", default=None)
+    parser.add_argument("--limit", type=int, default=8, help="Entries needed per feed (per_category * 2)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    report = []
+    for name, data in load_fixtures(args.fixtures).items():
+        full = measure(lambda: parse_with_feedparser(data)[: args.limit], args.repeat)
+        stream = measure(lambda: parse_feed(_chunks(data), limit=args.limit), args.repeat)
+        report.append(
+            {
+                "fixture": name,
+                "bytes": len(data),
+                "feedparser": full,
+                "stream": stream,
+                "cpu_speedup": round(full["cpu_ms"] / stream["cpu_ms"], 1) if stream["cpu_ms"] else None,
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
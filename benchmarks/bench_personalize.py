@@ -0,0 +1,137 @@
+"""Per-recipient personalization throughput in renders/sec.
+
+Streams synthetic recipient profiles from a CSV file (name, watchlist, market) and renders
+each recipient's email two ways: naively, with EMAIL_HTML_SHELL.format() plus a fresh MIME
+tree per recipient, and with personalize.Personalizer, which compiles the shells once and
+renders in batches into a pre-serialized MIME skeleton. Bodies-only rates (no MIME) are
+reported alongside.
+
+Usage:
+    python benchmarks/bench_personalize.py [--recipients 20000] [--batch 500] [--paragraphs 60]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import html
+import json
+import os
+import sys
+import tempfile
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mime_render import html_to_text  # noqa: E402
+from personalize import Personalizer, iter_recipient_records, recipient_values  # noqa: E402
+from templates import EMAIL_HTML_SHELL, EMAIL_TEXT_SHELL  # noqa: E402
+
+TICKERS = ["AAPL", "MSFT", "NVDA", "AMZN", "TSLA", "RELIANCE", "TCS", "INFY", "HDFCBANK", "JPM"]
+
+
+def write_profiles(path: Path, n: int) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "name", "watchlist", "market"])
+        for i in range(n):
+            watchlist = ";".join(TICKERS[(i + k) % len(TICKERS)] for k in range(i % 4))
+            writer.writerow([f"user{i}@example.com", f"User{i} Example", watchlist, "usa" if i % 3 else "india"])
+
+
+def naive_render(subject: str, html_body: str, from_header: str, generated_at: str, record: dict) -> bytes:
+    values = recipient_values(record)
+    text_body = html_to_text(html_body)
+    body = EMAIL_HTML_SHELL.format(subject=html.escape(subject), generated_at=generated_at, content_html=html_body, **values)
+    text = EMAIL_TEXT_SHELL.format(subject=subject, generated_at=generated_at, content_text=text_body, **values)
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = from_header
+    msg["To"] = record["email"]
+    msg.attach(MIMEText(text, "plain", _charset="utf-8"))
+    msg.attach(MIMEText(body, "html", _charset="utf-8"))
+    return msg.as_bytes()
+
+
+def rate(n: int, seconds: float, size: int) -> dict:
+    return {"seconds": round(seconds, 3), "renders_per_sec": round(n / seconds, 1), "bytes": size}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Personalized rendering throughput")
+    parser.add_argument("--recipients", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--naive-sample", type=int, default=2000, help="Recipients rendered by the naive path")
+    args = parser.parse_args()
+
+    os.environ.setdefault("UNSUBSCRIBE_URL", "https://example.com/unsubscribe?e={email}&t={token}")
+    os.environ.setdefault("UNSUBSCRIBE_SECRET", "bench")
+    subject = "Market Daily TL;DR — 2025-01-01"
+    from_header = "Market Daily TL;DR <bench@example.com>"
+    generated_at = "2025-01-01 06:00"
+    body = "<h2>Markets</h2>" + "<p>Stocks moved on the latest data.<br>Yields fell &amp; the dollar rose.</p>" * args.paragraphs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "recipients.csv"
+        write_profiles(path, args.recipients)
+        start = time.perf_counter()
+        profiles = {r["email"].lower(): r for r in iter_recipient_records(path)}
+        load_s = time.perf_counter() - start
+    recipients = list(profiles)
+    records = list(profiles.values())
+
+    sample = records[: args.naive_sample]
+    start = time.perf_counter()
+    size = sum(len(naive_render(subject, body, from_header, generated_at, r)) for r in sample)
+    naive = rate(len(sample), time.perf_counter() - start, size)
+
+    start = time.perf_counter()
+    text_body = html_to_text(body)
+    size = 0
+    for r in sample:
+        values = recipient_values(r)
+        size += len(EMAIL_HTML_SHELL.format(subject=subject, generated_at=generated_at, content_html=body, **values))
+        size += len(EMAIL_TEXT_SHELL.format(subject=subject, generated_at=generated_at, content_text=text_body, **values))
+    format_bodies = rate(len(sample), time.perf_counter() - start, size)
+
+    start = time.perf_counter()
+    personalizer = Personalizer(
+        subject=subject, html_body=body, from_header=from_header, profiles=profiles, generated_at=generated_at
+    )
+    compile_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = 0
+    for i in range(0, len(recipients), args.batch):
+        values = [recipient_values(profiles[r]) for r in recipients[i : i + args.batch]]
+        size += sum(map(len, personalizer.html.render_batch(values))) + sum(map(len, personalizer.text.render_batch(values)))
+    compiled_bodies = rate(len(recipients), time.perf_counter() - start, size)
+
+    start = time.perf_counter()
+    size = 0
+    for i in range(0, len(recipients), args.batch):
+        size += sum(map(len, personalizer.render_batch(recipients[i : i + args.batch])))
+    compiled = rate(len(recipients), time.perf_counter() - start, size)
+
+    print(
+        json.dumps(
+            {
+                "recipients": args.recipients,
+                "batch": args.batch,
+                "content_bytes": len(body),
+                "profile_load_s": round(load_s, 3),
+                "compile_s": round(compile_s, 4),
+                "bodies": {"format": format_bodies, "compiled": compiled_bodies},
+                "mime": {"naive": naive, "compiled": compiled},
+                "speedup": round(compiled["renders_per_sec"] / naive["renders_per_sec"], 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""End-to-end pipeline benchmark against local stand-ins for the feeds, OpenAI and SMTP.
+
+Runs the same entry points as daily_emailer.py --markets (fetch_news_context, then run_market
+per market: call_openai with its LLM cache and context packing, the outbox and deliver's
+batched drain) for each scenario a few times, and prints per-stage latency percentiles and
+throughput as JSON, so runs can be diffed across commits. Stage times come from the pipeline's
+own METRICS spans. Each iteration starts with an empty outbox and LLM cache (--warm-cache keeps
+the cache, to measure a rerun). Nothing leaves localhost: feeds come from a FeedServer
+(recorded fixtures via --fixtures, synthetic otherwise), completions from FakeOpenAI and mail
+goes to an SmtpSink.
+
+Scenarios:
+    baseline     1 market, 10 recipients
+    markets      --markets markets (default 3), 10 recipients each, generated side by side
+    recipients   1 market, --bulk-recipients recipients (default 10000)
+    slow_feeds   baseline with a quarter of the feeds delayed by --slow-feed-ms
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scenarios baseline,markets,recipients,slow_feeds]
+        [--iterations 3] [--fixtures DIR] [--warm-cache] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.standins import FakeOpenAI, FeedServer, SmtpSink, synthetic_rss  # noqa: E402
+
+STAGES = ("fetch", "pack", "ttft", "completion", "generate", "send", "market", "total")
+# Stage -> (METRICS section, name) it is read from
+METRIC_STAGES = {
+    "fetch": ("spans", "fetch"),
+    "pack": ("spans", "pack_context"),
+    "ttft": ("observations", "ttft_seconds"),
+    "completion": ("spans", "completion"),
+    "generate": ("spans", "generate"),
+    "send": ("spans", "deliver"),
+}
+FOCUSES = [
+    "United States (S&P 500, Fed, CPI/PPI, USD, UST rates, major US corporates)",
+    "India (NSE/BSE, RBI, INR, SEBI, NIFTY/BANK NIFTY, major Indian corporates)",
+    "United Kingdom (FTSE 100, BoE, GBP, gilts)",
+    "Japan (Nikkei 225, BoJ, JPY, JGBs)",
+    "Euro area (Euro Stoxx 50, ECB, EUR, Bunds)",
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(p: float) -> float:
+        # Nearest-rank percentile
+        rank = max(1, min(len(ordered), int(round(p / 100 * len(ordered) + 0.5))))
+        return round(ordered[rank - 1], 4)
+
+    return {
+        "n": len(ordered),
+        "p50": pct(50),
+        "p90": pct(90),
+        "p99": pct(99),
+        "max": round(ordered[-1], 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def point_feeds_at(server: FeedServer, slow_fraction: float, slow_delay: float) -> Dict[str, List[str]]:
+    import news_fetcher
+
+    # Same category layout and feed count as production, served from localhost
+    original = {cat: list(urls) for cat, urls in news_fetcher.RSS_FEEDS_BY_CATEGORY.items()}
+    n = 0
+    server.slow.clear()
+    slow_every = int(round(1 / slow_fraction)) if slow_fraction else 0
+    for category, urls in news_fetcher.RSS_FEEDS_BY_CATEGORY.items():
+        local = []
+        for _ in urls:
+            name = f"feed{n}.xml"
+            if slow_every and n % slow_every == 0:
+                server.slow[name] = slow_delay
+            local.append(server.url_for(name))
+            n += 1
+        news_fetcher.RSS_FEEDS_BY_CATEGORY[category] = local
+    return original
+
+
+def stage_values(snapshot: dict) -> Dict[str, List[float]]:
+    # Spans timed once per market (generate, deliver) keep their own values; the ones shared
+    # across markets (pack_context, completion, ttft) are summarized, so each contributes its mean
+    values: Dict[str, List[float]] = {stage: [] for stage in METRIC_STAGES}
+    for stage, (section, name) in METRIC_STAGES.items():
+        for entry in snapshot[section]:
+            if entry["name"] == name and entry["count"]:
+                values[stage].extend([entry["sum"] / entry["count"]] * entry["count"])
+    return values
+
+
+def run_once(markets: List[dict], recipients: List[str], cache_dir: str) -> Dict[str, List[float]]:
+    import daily_emailer
+    from metrics import METRICS
+
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    sent: List[int] = []
+    METRICS.rotate()
+    run_start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="bench-outbox-") as outbox_dir:
+        os.environ["LLM_CACHE_PATH"] = cache_dir
+        os.environ["OUTBOX_PATH"] = os.path.join(outbox_dir, "outbox.sqlite3")
+        outbox = daily_emailer.open_outbox()
+        news = daily_emailer.fetch_news_context(argparse.Namespace(no_news=False, replay=False))
+
+        def one_market(market: dict) -> float:
+            start = time.perf_counter()
+            sent.append(daily_emailer.run_market(market, news, recipients, dry_run=False, outbox=outbox))
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=len(markets), thread_name_prefix="market") as pool:
+            timings["market"].extend(pool.map(one_market, markets))
+
+    timings["total"].append(time.perf_counter() - run_start)
+    for stage, values in stage_values(METRICS.rotate().snapshot()).items():
+        timings[stage].extend(values)
+    timings["_sent"] = [float(sum(sent))]
+    return timings
+
+
+def run_scenario(config: dict, iterations: int, feeds: FeedServer, warm_cache: bool) -> dict:
+    original = point_feeds_at(feeds, config.get("slow_fraction", 0.0), config.get("slow_delay", 0.0))
+    import news_fetcher
+
+    markets = [{"name": f"m{i}", "focus": FOCUSES[i % len(FOCUSES)]} for i in range(config["markets"])]
+    recipients = [f"user{i}@example.com" for i in range(config["recipients"])]
+    collected: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    sent = 0
+    send_seconds = 0.0
+    feed_requests = feeds.requests
+    with tempfile.TemporaryDirectory(prefix="bench-llm-") as shared_cache:
+        try:
+            for i in range(iterations):
+                cache_dir = os.path.join(shared_cache, "llm" if warm_cache else f"llm{i}")
+                timings = run_once(markets, recipients, cache_dir)
+                sent += int(timings.pop("_sent")[0])
+                send_seconds += sum(timings["send"])
+                for stage, values in timings.items():
+                    collected[stage].extend(values)
+        finally:
+            news_fetcher.RSS_FEEDS_BY_CATEGORY.update(original)
+
+    total = sum(collected["total"])
+    return {
+        "config": config,
+        "iterations": iterations,
+        "stages_s": {stage: percentiles(values) for stage, values in collected.items() if values},
+        "throughput": {
+            "emails_sent": sent,
+            "send_msgs_per_s": round(sent / send_seconds, 1) if send_seconds else None,
+            "end_to_end_msgs_per_s": round(sent / total, 1) if total else None,
+            "feed_requests": feeds.requests - feed_requests,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--scenarios", default="baseline,markets,recipients,slow_feeds")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--fixtures", help="Directory of recorded *.xml feeds (synthetic if omitted)")
+    parser.add_argument("--markets", type=int, default=3, help="Markets in the 'markets' scenario")
+    parser.add_argument("--recipients", type=int, default=10, help="Recipients per market")
+    parser.add_argument("--bulk-recipients", type=int, default=10000, help="Recipients in the 'recipients' scenario")
+    parser.add_argument("--feed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--slow-feed-ms", type=float, default=2500.0)
+    parser.add_argument("--fetch-deadline", type=float, default=None, help="Override NEWS_FETCH_DEADLINE (seconds)")
+    parser.add_argument("--openai-ttft-ms", type=float, default=400.0)
+    parser.add_argument("--openai-tokens", type=int, default=600)
+    parser.add_argument("--openai-token-ms", type=float, default=2.0)
+    parser.add_argument("--stream", choices=["on", "off"], default="on")
+    parser.add_argument("--smtp-latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--warm-cache", action="store_true", help="Keep the LLM cache across iterations (later ones are cache hits)"
+    )
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        feeds = FeedServer.from_dir(args.fixtures, latency=args.feed_latency_ms / 1000)
+    else:
+        feeds = FeedServer({f"synthetic{i}.xml": synthetic_rss(f"synthetic{i}") for i in range(6)}, latency=args.feed_latency_ms / 1000)
+    feeds.start()
+    openai_server = FakeOpenAI(
+        ttft=args.openai_ttft_ms / 1000, tokens=args.openai_tokens, token_interval=args.openai_token_ms / 1000
+    ).start()
+    smtp = SmtpSink(latency=args.smtp_latency_ms / 1000).start()
+
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": openai_server.url,
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_STREAM": "1" if args.stream == "on" else "0",
+            "OPENAI_HEDGE": "0",
+            "OPENAI_LATENCY_HISTORY": str(ROOT / ".cache" / "bench_latency.json"),
+            "FEED_CACHE_DISABLE": "1",
+            "ARTICLE_STORE_DISABLE": "1",
+            "GMAIL_USERNAME": "bench@example.com",
+            "GMAIL_APP_PASSWORD": "bench",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(smtp.port),
+            "SMTP_STARTTLS": "0",
+            "LLM_CACHE": "file",
+            "OUTBOX_DISABLE": "0",
+            "OUTBOX_STORE_ADDRESSES": "1",
+        }
+    )
+    for name in ("NEWSAPI_KEY", "OUTBOX_BATCH", "OPENAI_MAP_REDUCE", "EMAIL_FROM_ADDRESS"):
+        os.environ.pop(name, None)
+    if args.fetch_deadline is not None:
+        os.environ["NEWS_FETCH_DEADLINE"] = str(args.fetch_deadline)
+
+    scenarios = {
+        "baseline": {"markets": 1, "recipients": args.recipients},
+        "markets": {"markets": args.markets, "recipients": args.recipients},
+        "recipients": {"markets": 1, "recipients": args.bulk_recipients},
+        "slow_feeds": {
+            "markets": 1,
+            "recipients": args.recipients,
+            "slow_fraction": 0.25,
+            "slow_delay": args.slow_feed_ms / 1000,
+        },
+    }
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(scenarios)})")
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "stand_ins": {
+            "feed_latency_ms": args.feed_latency_ms,
+            "openai_ttft_ms": args.openai_ttft_ms,
+            "openai_tokens": args.openai_tokens,
+            "openai_token_ms": args.openai_token_ms,
+            "stream": args.stream,
+            "smtp_latency_ms": args.smtp_latency_ms,
+            "fixtures": args.fixtures or "synthetic",
+            "warm_cache": args.warm_cache,
+        },
+        "scenarios": {},
+    }
+    # The pipeline's own progress lines go to stderr so stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in selected:
+            report["scenarios"][name] = run_scenario(scenarios[name], args.iterations, feeds, args.warm_cache)
+
+    for server in (feeds, openai_server, smtp):
+        server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
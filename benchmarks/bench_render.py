@@ -0,0 +1,89 @@
+"""Compare per-recipient message rendering: rebuilding the MIME tree for every recipient
+(the previous code path) against rendering once and stamping the To header.
+
+Usage:
+    python benchmarks/bench_render.py [--recipients 10000] [--paragraphs 60]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import time
+import timeit
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mime_render import MessageTemplate, html_to_text  # noqa: E402
+
+
+def legacy_html_to_text(html: str) -> str:
+    text = re.sub(r"<\s*br\s*/?>", "\n", html, flags=re.IGNORECASE)
+    text = re.sub(r"<\s*/p\s*>", "\n\n", text, flags=re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", "", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def legacy_render(subject: str, html_body: str, from_header: str, recipient: str) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = from_header
+    msg["To"] = recipient
+    msg.attach(MIMEText(legacy_html_to_text(html_body) or subject, "plain", _charset="utf-8"))
+    msg.attach(MIMEText(html_body, "html", _charset="utf-8"))
+    return msg.as_string()
+
+
+def timed(fn, n: int) -> dict:
+    start = time.perf_counter()
+    size = 0
+    for i in range(n):
+        size += len(fn(f"user{i}@example.com"))
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "msgs_per_sec": round(n / elapsed, 1), "bytes": size}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MIME rendering throughput")
+    parser.add_argument("--recipients", type=int, default=10000)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    args = parser.parse_args()
+
+    subject = "Market Daily TL;DR — 2025-01-01"
+    from_header = "Market Daily TL;DR <bench@example.com>"
+    html = "<h2>Markets</h2>" + "<p>Stocks moved on the latest data.<br>Yields fell &amp; the dollar rose.</p>" * args.paragraphs
+
+    legacy = timed(lambda r: legacy_render(subject, html, from_header, r), args.recipients)
+
+    start = time.perf_counter()
+    template = MessageTemplate(subject=subject, html_body=html, from_header=from_header)
+    build_s = time.perf_counter() - start
+    current = timed(template.render, args.recipients)
+    current["template_build_s"] = round(build_s, 4)
+
+    # Best of several rounds, so a busy machine doesn't skew the comparison
+    loops = 500
+    legacy_text_us = min(timeit.repeat(lambda: legacy_html_to_text(html), number=loops, repeat=15)) / loops * 1e6
+    text_us = min(timeit.repeat(lambda: html_to_text(html), number=loops, repeat=15)) / loops * 1e6
+
+    print(
+        json.dumps(
+            {
+                "recipients": args.recipients,
+                "html_bytes": len(html),
+                "legacy": legacy,
+                "render_once": current,
+                "speedup": round(current["msgs_per_sec"] / legacy["msgs_per_sec"], 1),
+                "html_to_text_us": {"legacy_four_pass": round(legacy_text_us, 1), "current": round(text_us, 1)},
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure bulk SendGrid submission against a local stand-in for the v3 API.
+
+Usage:
+    python benchmarks/bench_sendgrid.py [--recipients 20000] [--concurrency 1,4,8]
+        [--latency-ms 150] [--throttle-every 7]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.standins import SendGridStandin  # noqa: E402
+from email_providers import send_via_sendgrid  # noqa: E402
+
+HTML = "<h2>Markets</h2>" + "<p>Stocks moved on the latest data. Yields fell.</p>" * 60
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SendGrid bulk throughput")
+    parser.add_argument("--recipients", type=int, default=20000)
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="Simulated API latency per request")
+    parser.add_argument("--throttle-every", type=int, default=7, help="Answer every Nth request with 429")
+    args = parser.parse_args()
+
+    standin = SendGridStandin(latency=args.latency_ms / 1000, throttle_every=args.throttle_every).start()
+    os.environ.update({"SENDGRID_API_KEY": "bench", "SENDGRID_API_HOST": standin.url})
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+
+    results = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        os.environ["SENDGRID_CONCURRENCY"] = str(concurrency)
+        before_requests, before_accepted = standin.requests, standin.accepted_requests
+        report = send_via_sendgrid(
+            subject="Benchmark",
+            html_body=HTML,
+            recipients=recipients,
+            from_address="bench@example.com",
+            from_name="Bench",
+        )
+        results.append(
+            {
+                "concurrency": concurrency,
+                "recipients": len(recipients),
+                "requests": standin.requests - before_requests,
+                "accepted_requests": standin.accepted_requests - before_accepted,
+                "failed": len(report.failed),
+                "seconds": round(report.elapsed, 3),
+                "recipients_per_sec": round(report.rate, 1),
+            }
+        )
+    standin.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
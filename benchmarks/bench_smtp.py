@@ -0,0 +1,67 @@
+"""Measure SMTP delivery throughput against a local SMTP stand-in.
+
+Usage:
+    python benchmarks/bench_smtp.py [--recipients 2000] [--workers 1,4,8] [--latency-ms 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.standins import SmtpSink  # noqa: E402
+from email_providers import send_via_gmail  # noqa: E402
+
+HTML = "<h2>Markets</h2>" + "<p>Stocks moved on the latest data. Yields fell.</p>" * 60
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SMTP delivery throughput")
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--workers", default="1,4,8")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated per-message server latency")
+    args = parser.parse_args()
+
+    sink = SmtpSink(latency=args.latency_ms / 1000).start()
+    os.environ.update(
+        {
+            "GMAIL_USERNAME": "bench@example.com",
+            "GMAIL_APP_PASSWORD": "bench",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(sink.port),
+            "SMTP_STARTTLS": "0",
+        }
+    )
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        os.environ["SMTP_WORKERS"] = str(workers)
+        before = sink.messages
+        report = send_via_gmail(
+            subject="Benchmark",
+            html_body=HTML,
+            recipients=recipients,
+            from_address="bench@example.com",
+            from_name="Bench",
+        )
+        results.append(
+            {
+                "workers": workers,
+                "recipients": len(recipients),
+                "delivered": sink.messages - before,
+                "failed": len(report.failed),
+                "seconds": round(report.elapsed, 3),
+                "msgs_per_sec": round(report.rate, 1),
+            }
+        )
+    sink.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
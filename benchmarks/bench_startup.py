@@ -0,0 +1,100 @@
+"""Measure daily_emailer cold start and fail if it regresses.
+
+Each sample is a fresh interpreter. Reports the cumulative `-X importtime` figure for
+daily_emailer, the wall time of `daily_emailer.py --help`, and the in-process time to the
+first stage (parse arguments, load recipients). Exits 1 if the median import time exceeds
+--max-import-ms or if any heavy client library is imported before it is needed.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7] [--max-import-ms 150]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Must stay out of sys.modules until the stage that actually uses them
+DEFERRED = ("openai", "dotenv", "requests", "feedparser", "sendgrid", "tiktoken", "news_fetcher", "email_providers")
+
+FIRST_STAGE = f"""
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+import daily_emailer
+sys.argv = ["daily_emailer.py", "--to", "a@example.com,b@example.com", "--dry-run"]
+args = daily_emailer.parse_args()
+with contextlib.redirect_stdout(io.StringIO()):
+    daily_emailer.load_recipients(args)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {DEFERRED!r} if m in sys.modules]}}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| daily_emailer$", re.MULTILINE)
+
+
+def import_ms() -> float:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import daily_emailer"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    match = _IMPORTTIME.search(proc.stderr)
+    if match is None:
+        raise SystemExit("daily_emailer missing from -X importtime output")
+    return int(match.group(1)) / 1000
+
+
+def help_ms() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "daily_emailer.py", "--help"], cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def first_stage() -> dict:
+    proc = subprocess.run([sys.executable, "-c", FIRST_STAGE], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="daily_emailer startup benchmark")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--max-import-ms", type=float, default=150.0, help="Budget for the median import time")
+    args = parser.parse_args()
+
+    imports = [import_ms() for _ in range(args.runs)]
+    helps = [help_ms() for _ in range(args.runs)]
+    stages = [first_stage() for _ in range(args.runs)]
+    loaded = sorted({m for s in stages for m in s["loaded"]})
+
+    result = {
+        "runs": args.runs,
+        "import_ms_median": round(statistics.median(imports), 1),
+        "import_ms_max": round(max(imports), 1),
+        "help_wall_ms_median": round(statistics.median(helps), 1),
+        "first_stage_ms_median": round(statistics.median(s["seconds"] for s in stages) * 1000, 1),
+        "deferred_modules_loaded": loaded,
+        "max_import_ms": args.max_import_ms,
+    }
+    print(json.dumps(result, indent=2))
+
+    problems = []
+    if result["import_ms_median"] > args.max_import_ms:
+        problems.append(f"median import {result['import_ms_median']}ms exceeds {args.max_import_ms}ms")
+    if loaded:
+        problems.append(f"imported before first use: {', '.join(loaded)}")
+    if problems:
+        print("Startup regression: " + "; ".join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Local stand-ins for the external services the pipeline talks to."""
+from __future__ import annotations
+
+import json
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+
+def _quiet_disconnects(server: socketserver.BaseServer, request, client_address) -> None:
+    # Clients that stop reading early (the streaming feed parser, cancelled completions) are
+    # expected; anything else is still reported.
+    if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+        return
+    socketserver.BaseServer.handle_error(server, request, client_address)
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        server: "SmtpSink" = self.server  # type: ignore[assignment]
+        self._reply("220 localhost stand-in ESMTP")
+        recipients = 0
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            cmd = raw.decode("utf-8", "replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in {"EHLO", "HELO"}:
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                recipients = 0
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients += 1
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    size += len(line)
+                if server.latency:
+                    time.sleep(server.latency)
+                server.record(recipients, size)
+                self._reply("250 OK queued")
+            elif verb in {"RSET", "NOOP"}:
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    # Accepts any login and counts messages/recipients/bytes; `latency` delays each DATA reply.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _SmtpHandler)
+        self.latency = latency
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, recipients: int, size: int) -> None:
+        with self._lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+    def start(self) -> "SmtpSink":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _SendGridHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        server: "SendGridStandin" = self.server  # type: ignore[assignment]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if server.latency:
+            time.sleep(server.latency)
+        n = server.next_request()
+        if server.throttle_every and n % server.throttle_every == 0:
+            self._send(429, b'{"errors":[{"message":"too many requests"}]}', {"Retry-After": "0.05"})
+            return
+        payload = json.loads(body)
+        server.record(len(payload.get("personalizations") or []), len(body))
+        self._send(202, b"")
+
+    def _send(self, status: int, body: bytes, headers: dict | None = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class SendGridStandin(ThreadingHTTPServer):
+    # Accepts POST /v3/mail/send and counts personalizations; every `throttle_every`-th
+    # request is answered with 429 to exercise retry/backoff.
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, throttle_every: int = 0, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _SendGridHandler)
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.accepted_requests = 0
+        self.personalizations = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def record(self, personalizations: int, size: int) -> None:
+        with self._lock:
+            self.accepted_requests += 1
+            self.personalizations += personalizations
+            self.bytes += size
+
+    def start(self) -> "SendGridStandin":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def synthetic_rss(name: str, items: int = 40, body_chars: int = 2000) -> bytes:
+    body = ("Stocks, bonds and currencies moved on the latest economic data. " * (body_chars // 64 + 1))[:body_chars]
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>',
+        f"<title>{name}</title><link>https://example.com/{name}</link>",
+    ]
+    for i in range(items):
+        parts.append(
+            f"<item><title>{name} story {i}: earnings, rates and energy in focus</title>"
+            f"<link>https://example.com/{name}/story/{i}?utm_source=rss</link>"
+            f"<pubDate>Mon, 06 Jan 2025 {i % 24:02d}:{i % 60:02d}:00 GMT</pubDate>"
+            f"<description><![CDATA[<p>{body}</p>]]></description></item>"
+        )
+    parts.append("</channel></rss>")
+    return "".join(parts).encode("utf-8")
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server: "FeedServer" = self.server  # type: ignore[assignment]
+        name = self.path.rsplit("/", 1)[-1]
+        body = server.body_for(name)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        delay = server.slow.get(name, server.latency)
+        if delay:
+            time.sleep(delay)
+        server.record(len(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FeedServer(ThreadingHTTPServer):
+    # Serves recorded feed fixtures at /feeds/<name>. Names beyond the fixture list reuse them
+    # round-robin; `slow` maps a name to its own delay (e.g. longer than the fetch deadline).
+    daemon_threads = True
+    handle_error = _quiet_disconnects
+
+    def __init__(self, fixtures: Dict[str, bytes], latency: float = 0.0, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _FeedHandler)
+        if not fixtures:
+            raise ValueError("FeedServer needs at least one fixture")
+        self.fixtures = fixtures
+        self._ordered = [fixtures[k] for k in sorted(fixtures)]
+        self.latency = latency
+        self.slow: Dict[str, float] = {}
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dir(cls, directory: str | Path, **kwargs) -> "FeedServer":
+        fixtures = {p.name: p.read_bytes() for p in sorted(Path(directory).glob("*.xml"))}
+        return cls(fixtures, **kwargs)
+
+    def url_for(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/feeds/{name}"
+
+    def body_for(self, name: str) -> bytes | None:
+        if name in self.fixtures:
+            return self.fixtures[name]
+        digits = "".join(ch for ch in name if ch.isdigit())
+        if not digits:
+            return None
+        return self._ordered[int(digits) % len(self._ordered)]
+
+    def record(self, size: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+
+    def start(self) -> "FeedServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        server: "FakeOpenAI" = self.server  # type: ignore[assignment]
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        server.record(request)
+        model = request.get("model") or "gpt-4o"
+        tokens = server.completion_tokens()
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages") or []),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if server.ttft:
+            time.sleep(server.ttft)
+
+        if not request.get("stream"):
+            time.sleep(server.token_interval * len(tokens))
+            self._json(
+                200,
+                {
+                    "id": "chatcmpl-standin",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: dict, finish: str | None = None, with_usage: bool = False) -> None:
+            chunk = {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if not with_usage else [],
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for token in tokens:
+                event({"content": token})
+                if server.token_interval:
+                    time.sleep(server.token_interval)
+            event({}, finish="stop")
+            if (request.get("stream_options") or {}).get("include_usage"):
+                event({}, with_usage=True)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    # Chat-completions endpoint (blocking and SSE streaming). `ttft` delays the first token,
+    # then `tokens` chunks follow `token_interval` apart. Point the client at `.url`
+    # (e.g. OPENAI_BASE_URL).
+    daemon_threads = True
+    handle_error = _quiet_disconnects
+
+    def __init__(self, ttft: float = 0.3, tokens: int = 400, token_interval: float = 0.002, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _OpenAIHandler)
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.requests = 0
+        self.streamed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def completion_tokens(self) -> List[str]:
+        words = ["<h2>Markets</h2>", "<p>"] + ["Stocks "] * max(0, self.tokens - 3) + ["</p>"]
+        return words[: max(1, self.tokens)]
+
+    def record(self, request: dict) -> None:
+        with self._lock:
+            self.requests += 1
+            if request.get("stream"):
+                self.streamed += 1
+
+    def start(self) -> "FakeOpenAI":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
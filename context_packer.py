@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from env import get_int
+
+# gpt-4o family encoding; override with PROMPT_TOKENIZER for other models
+DEFAULT_ENCODING = "o200k_base"
+
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # Imported on first use, so runs that never build a prompt don't pay for it
+    try:
+        import tiktoken  # type: ignore
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    try:
+        return tiktoken.get_encoding(os.getenv("PROMPT_TOKENIZER", DEFAULT_ENCODING))
+    except Exception:
+        # BPE files are downloaded on first use; offline runners fall back to the estimate
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # Roughly one token per short word piece or punctuation mark
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def _split_item(line: str) -> Tuple[str, str]:
+    # "- Title (meta) — link" -> ("Title", " (meta) — link")
+    body = line[2:]
+    head, sep, link = body.rpartition(" — ")
+    if not sep:
+        head, link = body, ""
+    title, paren, meta = head.rpartition(" (")
+    if not paren:
+        title, meta = head, ""
+    tail = (f" ({meta}" if paren else "") + (f" — {link}" if sep else "")
+    return title, tail
+
+
+def shorten_title(line: str, max_chars: int) -> str:
+    if not line.startswith("- "):
+        return line
+    title, tail = _split_item(line)
+    if len(title) <= max_chars:
+        return line
+    cut = title[:max_chars].rsplit(" ", 1)[0] or title[:max_chars]
+    return f"- {cut.rstrip(' ,;:-')}…{tail}"
+
+
+def _parse_sections(context: str) -> List[Tuple[List[str], List[str]]]:
+    sections: List[Tuple[List[str], List[str]]] = []
+    for block in context.split("\n\n"):
+        if not block.strip():
+            continue
+        header: List[str] = []
+        items: List[str] = []
+        for line in block.split("\n"):
+            (items if line.startswith("- ") else header).append(line)
+        sections.append((header, items))
+    return sections
+
+
+def _section_tokens(header: List[str], items: List[str]) -> int:
+    lines = header + items
+    return sum(count_tokens(line) for line in lines) + len(lines)
+
+
+def pack_context(
+    context: str,
+    *,
+    total_budget: int | None = None,
+    category_budget: int | None = None,
+    title_chars: int | None = None,
+) -> Tuple[str, Dict[str, int]]:
+    # Fits a "Category:\n- item\n- item" context (items in rank order, as NewsFetcher emits
+    # them) into token budgets: long titles are shortened first, then the lowest-ranked
+    # items are dropped, per category and then overall.
+    total_budget = total_budget or get_int("PROMPT_CONTEXT_TOKENS", 3000)
+    category_budget = category_budget or get_int("PROMPT_CATEGORY_TOKENS", 600)
+    title_chars = title_chars or get_int("PROMPT_TITLE_CHARS", 140)
+
+    sections = _parse_sections(context or "")
+    report = {
+        "tokens_before": count_tokens(context) if context else 0,
+        "tokens_after": 0,
+        "items_before": sum(len(items) for _, items in sections),
+        "items_dropped": 0,
+        "titles_shortened": 0,
+    }
+
+    packed: List[Tuple[List[str], List[str]]] = []
+    for header, items in sections:
+        short = [shorten_title(line, title_chars) for line in items]
+        report["titles_shortened"] += sum(a != b for a, b in zip(items, short))
+        while short and _section_tokens(header, short) > category_budget:
+            short.pop()
+            report["items_dropped"] += 1
+        packed.append((header, short))
+
+    # Over the total budget: drop the lowest-ranked remaining item from the largest section
+    total = sum(_section_tokens(h, i) for h, i in packed) + len(packed)
+    while total > total_budget:
+        candidates = [(len(items), n) for n, (_, items) in enumerate(packed) if items]
+        if not candidates:
+            break
+        _, n = max(candidates)
+        header, items = packed[n]
+        line = items.pop()
+        total -= count_tokens(line) + 1
+        report["items_dropped"] += 1
+
+    # Category headers without any items left carry no information
+    blocks = [
+        "\n".join(header + items)
+        for header, items in packed
+        if items or not any(line.rstrip().endswith(":") for line in header)
+    ]
+    text = "\n\n".join(blocks)
+    report["tokens_after"] = count_tokens(text) if text else 0
+    return text, report
@@ -1,17 +1,28 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Dict, Iterable, List
 import re
 
-from dotenv import load_dotenv
-from openai import OpenAI
+# Heavier clients (openai, dotenv, requests, feedparser, sendgrid, tiktoken) are imported inside
+# the functions that use them, so --help, argument errors and recipient loading start fast
+from env import get_bool, get_float, get_int
+from llm_cache import open_response_cache, replay_key, response_key
+from llm_stream import complete
+from markets import BUILTIN_MARKETS, load_market_config, market_recipients, select_markets
+from metrics import METRICS, Metrics
+from outbox import Outbox
+from templates import get_system_instructions, build_email_subject, build_user_prompt, get_prompt_body
 
-from email_providers import send_email
-from templates import get_system_instructions, build_email_subject, build_user_prompt
+if TYPE_CHECKING:
+    from personalize import ProfileStore
+    from recipients import RecipientStream
 
 MODEL_NAME = "gpt-4o"
 
@@ -20,72 +31,272 @@ def get_model_name() -> str:
     return os.getenv("OPENAI_MODEL_OVERRIDE", MODEL_NAME)
 
 
+def get_max_tokens() -> int:
+    return get_int("OPENAI_MAX_TOKENS", 1200)
+
+
+def get_request_timeout() -> float:
+    return get_float("OPENAI_TIMEOUT", 120.0)
+
+
+def _shard_arg(value: str):
+    from recipients import parse_shard
+
+    try:
+        return parse_shard(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Market Daily TL;DR emailer")
     parser.add_argument("--to", help="Comma-separated email addresses", default=None)
     parser.add_argument("--recipients", help="Path to file with one email per line", default=None)
-    parser.add_argument("--no-news", action="store_true", help="(unused) kept for compatibility")
+    parser.add_argument("--no-news", action="store_true", help="Skip fetching news context")
     parser.add_argument("--subject-prefix", help="Optional subject prefix", default=None)
     parser.add_argument("--dry-run", action="store_true", help="Print output instead of sending email")
+    parser.add_argument(
+        "--markets",
+        help="Comma-separated markets to generate and send in one run (e.g. usa,india)",
+        default=None,
+    )
+    parser.add_argument("--markets-config", help="JSON file defining or overriding markets", default=None)
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Reuse today's cached completion instead of calling the model (fails if none)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Only deliver recipients still queued in today's outbox; never generates a new body",
+    )
+    parser.add_argument(
+        "--prepare-only",
+        action="store_true",
+        help="Generate today's email and store it in the outbox without sending (for --shard jobs to send)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard_arg,
+        help="Only deliver to shard i of N (0-based, e.g. 0/4), split by a stable hash of each address",
+        default=None,
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and send each market at its own local send_at time (all markets unless --markets)",
+    )
+    parser.add_argument("--once", action="store_true", help="With --daemon, exit after each market has sent once")
+    parser.add_argument(
+        "--report",
+        help="Where to write the JSON run report (default: RUN_REPORT_PATH or .cache/run_report.json)",
+        default=None,
+    )
+    parser.add_argument(
+        "--prometheus",
+        help="Also write metrics in Prometheus text format to this file (default: METRICS_PROM_PATH)",
+        default=None,
+    )
     return parser.parse_args()
 
 
-def load_recipients(args: argparse.Namespace) -> List[str]:
-    candidates: List[str] = []
+def load_recipients(args: argparse.Namespace) -> RecipientStream:
+    # Streamed, not loaded: one counting pass here, then each send re-reads the sources
+    from recipients import RecipientStream
+
+    addresses: List[str] = []
+    files: List[Path] = []
 
     if args.to:
-        candidates.extend([addr.strip() for addr in args.to.split(",") if addr.strip()])
+        addresses.extend([addr.strip() for addr in args.to.split(",") if addr.strip()])
 
     if args.recipients:
         path = Path(args.recipients)
         if not path.exists():
             raise SystemExit(f"Recipients file not found: {path}")
-        with path.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    candidates.append(line)
+        files.append(path)
 
-    if not candidates:
+    stream = RecipientStream(addresses=addresses, files=files, shard=args.shard)
+    stats = stream.scan()
+    if not stats["read"]:
         env_default = os.getenv("DEFAULT_RECIPIENTS", "").strip()
         if env_default:
-            candidates.extend([addr.strip() for addr in env_default.split(",") if addr.strip()])
+            addresses = [addr.strip() for addr in env_default.split(",") if addr.strip()]
+            stream = RecipientStream(addresses=addresses, shard=args.shard)
+            stats = stream.scan()
 
-    unique = sorted(set(candidates))
-    if not unique:
+    if not stats["unique"]:
         raise SystemExit("No recipients provided. Use --to, --recipients, or DEFAULT_RECIPIENTS in env.")
-    return unique
+    print(f"Recipients: {stream.summary()}")
+    return stream
+
+
+def load_profiles(paths: List[str | None], shard=None) -> ProfileStore | None:
+    # Recipient attributes (name, watchlist, market, unsubscribe link) from CSV/JSONL
+    # recipient files, keyed by lowercased address, for this shard only. None when every list
+    # is plain addresses, in which case emails are sent unpersonalized. Streamed into a
+    # ProfileStore, which moves to disk past PROFILE_MEMORY records.
+    if not any(paths):
+        return None
+    from personalize import ProfileStore, is_profile_file, iter_recipient_records
+    from recipients import address_digest, normalize_address
+
+    files = [Path(p) for p in paths if p and is_profile_file(p) and Path(p).exists()]
+    if not files:
+        return None
+
+    profiles = ProfileStore()
+    for path in files:
+        for record in iter_recipient_records(path):
+            address = normalize_address(record["email"])
+            if address is None or (shard is not None and address_digest(address) % shard[1] != shard[0]):
+                continue
+            profiles.add(address, record)
+    return profiles
+
+
+def for_market(recipients: RecipientStream, market: str, profiles: ProfileStore | None) -> RecipientStream:
+    # Recipients whose profile names a preferred market only get that market's email
+    if not profiles:
+        return recipients
+    return recipients.filtered(lambda r: profiles.get(r.lower(), {}).get("market") in (None, "", market))
+
+
+def call_openai(
+    news_context: str,
+    focus: str | None = None,
+    system_msg: str | None = None,
+    prompt_body: str | None = None,
+    replay: bool = False,
+    day: str | None = None,
+    label: str = "",
+) -> str:
+    # `label` (e.g. "[usa] ") prefixes progress lines, which market threads print side by side.
+    # `day` dates the prompt and the cache/--replay entries (YYYY-MM-DD); the daemon passes each
+    # market's local date
+    if focus is None:
+        focus = (os.getenv("FOCUS_MARKET") or "").strip()
+    system_msg = system_msg or get_system_instructions(focus)
+    model = get_model_name()
+    max_tokens = get_max_tokens()
+    temperature = 0.2
+
+    cache = open_response_cache()
+    replay_id = replay_key(model, system_msg, focus, day)
+    if replay:
+        entry = cache.get_latest(replay_id) if cache is not None else None
+        if entry is None:
+            raise SystemExit("--replay: no cached completion for today's run of this market")
+        METRICS.incr("llm_cache_hits", kind="replay")
+        return entry["content"]
 
-
-def call_openai(news_context: str) -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise SystemExit("OPENAI_API_KEY not set")
 
-    client = OpenAI(api_key=api_key)
-
-    focus = (os.getenv("FOCUS_MARKET") or "").strip()
-    system_msg = get_system_instructions(focus)
-    user_msg = build_user_prompt(news_context, focus)
+    import map_reduce
+    from context_packer import pack_context
+
+    with METRICS.span("pack_context"):
+        packed_context, report = pack_context(news_context)
+    if report["items_dropped"] or report["titles_shortened"]:
+        with _print_lock:
+            print(
+                f"{label}Packed news context {report['tokens_before']} -> {report['tokens_after']} tokens "
+                f"({report['items_dropped']} items dropped, {report['titles_shortened']} titles shortened)"
+            )
+    user_msg = build_user_prompt(packed_context, focus, prompt_body, day)
+
+    plan = None
+    if map_reduce.map_reduce_enabled():
+        plan = map_reduce.split_prompt_body(get_prompt_body(focus, prompt_body))
+        if plan is None:
+            with _print_lock:
+                print(f"{label}Prompt has no category list to split; generating the email in one call")
+
+    # The assembled map-reduce email is cached under its own key, so --replay finds it too
+    key = response_key(model, system_msg, user_msg if plan is None else f"map-reduce\n{user_msg}", temperature, max_tokens)
+    if cache is not None:
+        entry = cache.get(key, day)
+        if entry is not None:
+            with _print_lock:
+                print(f"{label}Using cached completion")
+            METRICS.incr("llm_cache_hits", kind="response")
+            return entry["content"]
+
+    from openai import OpenAI
+
+    client = OpenAI(api_key=api_key, timeout=get_request_timeout())
+    if plan is None:
+        content = _complete(client, model, system_msg, user_msg, temperature, max_tokens, label=label)
+    else:
+
+        def generate_part(part_msg: str, part_tokens: int, part: str) -> str:
+            # Each category (and the merge) is cached on its own, so a rerun after a partial
+            # failure only pays for the parts that did not finish
+            part_key = response_key(model, system_msg, part_msg, temperature, part_tokens)
+            if cache is not None:
+                entry = cache.get(part_key, day)
+                if entry is not None:
+                    METRICS.incr("llm_cache_hits", kind="map")
+                    return entry["content"]
+            text = _complete(client, model, system_msg, part_msg, temperature, part_tokens, part=part, label=label)
+            if cache is not None and text.strip():
+                part_replay = replay_key(model, system_msg, f"{focus}\n{part}", day)
+                cache.put(part_key, part_replay, text, {"model": model, "focus": focus, "part": part}, day)
+            return text
+
+        content = map_reduce.generate(generate_part, packed_context, plan, day)
 
-    completion = client.chat.completions.create(
-        model=get_model_name(),
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_msg},
-        ],
-        temperature=0.2,
-        max_tokens=1200,
-    )
-
-    content = completion.choices[0].message.content or ""
     if not content.strip():
         raise SystemExit("Model returned empty content; aborting send.")
+    if cache is not None:
+        cache.put(key, replay_id, content, {"model": model, "focus": focus}, day)
+        cache.evict(day)
+    return content
+
+
+def _complete(
+    client,
+    model: str,
+    system_msg: str,
+    user_msg: str,
+    temperature: float,
+    max_tokens: int,
+    part: str = "",
+    label: str = "",
+) -> str:
+    with METRICS.span("completion", model=model):
+        content, stats = complete(
+            client,
+            model=model,
+            messages=[
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": user_msg},
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+    # Usage comes from the API's usage block (the final stream chunk when streaming)
+    METRICS.incr("prompt_tokens", stats.get("prompt_tokens") or 0, model=stats["model"])
+    METRICS.incr("completion_tokens", stats.get("completion_tokens") or 0, model=stats["model"])
+    if stats.get("ttft_s") is not None:
+        METRICS.observe("ttft_seconds", stats["ttft_s"], model=stats["model"])
+        hedge_note = f", hedged ({stats['winner']} won)" if stats.get("hedged") else ""
+        part_note = f" [{part}]" if part else ""
+        with _print_lock:
+            print(
+                f"{label}Completion{part_note} from {stats['model']}: first token {stats['ttft_s']}s, "
+                f"total {stats['total_s']}s, {stats['completion_tokens']} tokens at {stats['tokens_per_s']} tok/s"
+                f"{hedge_note}"
+            )
     return content
 
 
-def build_focus_context() -> str:
-    focus = (os.getenv("FOCUS_MARKET") or "").strip()
+def build_focus_context(focus: str | None = None) -> str:
+    if focus is None:
+        focus = (os.getenv("FOCUS_MARKET") or "").strip()
     if not focus:
         return ""
     return (
@@ -94,6 +305,25 @@ def build_focus_context() -> str:
     )
 
 
+def fetch_news_context(args: argparse.Namespace) -> str:
+    if args.no_news or args.replay:
+        return ""
+    try:
+        from news_fetcher import NewsFetcher
+
+        with METRICS.span("fetch"):
+            return NewsFetcher().fetch_context()
+    except Exception as exc:
+        METRICS.incr("news_fetch_failures")
+        # News is supplementary; the model falls back to its own knowledge without it
+        print(f"News fetch failed, continuing without it: {exc}")
+        return ""
+
+
+def build_market_context(news_context: str, focus: str | None = None) -> str:
+    return "\n\n".join(part for part in (build_focus_context(focus), news_context) if part)
+
+
 def _default_disclaimer() -> str:
     return (
         "<hr style=\"border:none;border-top:1px solid #eee;margin:16px 0;\">"
@@ -113,18 +343,318 @@ def _inject_disclaimer(html_body: str) -> str:
     return html_body + disclaimer
 
 
-def main() -> None:
-    load_dotenv(override=False)
+def _sender() -> tuple[str, str]:
+    from_address = os.getenv("EMAIL_FROM_ADDRESS") or os.getenv("GMAIL_USERNAME")
+    if not from_address:
+        raise SystemExit("EMAIL_FROM_ADDRESS or GMAIL_USERNAME must be set for sender address")
+    return from_address, os.getenv("EMAIL_FROM_NAME", "Market Daily TL;DR")
 
-    args = parse_args()
-    recipients = load_recipients(args)
 
-    subject_prefix = args.subject_prefix or os.getenv("SUBJECT_PREFIX", "").strip() or None
-    subject = build_email_subject(subject_prefix)
+def open_outbox() -> Outbox | None:
+    if get_bool("OUTBOX_DISABLE"):
+        return None
+    return Outbox(
+        max_attempts=get_int("OUTBOX_MAX_ATTEMPTS", 3), store_addresses=get_bool("OUTBOX_STORE_ADDRESSES", True)
+    )
 
-    focus_ctx = build_focus_context()
-    body = call_openai(news_context=focus_ctx)
-    body_with_disclaimer = _inject_disclaimer(body)
+
+def run_date() -> str:
+    # Same day string the subject line carries
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def outbox_key(focus: str | None, system_msg: str | None = None, prompt_body: str | None = None) -> str:
+    # The outbox stores one body per (day, key), so the key comes from what decides the email's
+    # content. A single run with FOCUS_MARKET and --markets for the same market share it (the
+    # built-in markets keep their names), and two different markets never do.
+    focus = (focus or "").strip()
+    if not system_msg and not prompt_body:
+        for name, cfg in BUILTIN_MARKETS.items():
+            if cfg["focus"] == focus:
+                return name
+    digest = hashlib.blake2b("\0".join((focus, system_msg or "", prompt_body or "")).encode("utf-8"), digest_size=4)
+    slug = re.sub(r"[^a-z0-9]+", "-", focus.split("(")[0].lower()).strip("-")[:32] or "default"
+    return f"{slug}-{digest.hexdigest()}"
+
+
+def market_outbox_key(market: dict) -> str:
+    return outbox_key(market.get("focus"), market.get("system_instructions"), market.get("prompt_body"))
+
+
+def stored_body(outbox: Outbox | None, market_key: str, resume: bool, shard=None) -> dict | None:
+    if resume and outbox is not None and not outbox.store_addresses:
+        raise SystemExit(
+            "--resume drains stored addresses, and OUTBOX_STORE_ADDRESSES=0 stores none; rerun without "
+            "--resume, which only sends to recipients not yet delivered today"
+        )
+    stored = outbox.get_message(run_date(), market_key) if outbox is not None else None
+    if resume and stored is None:
+        raise SystemExit(f"--resume: nothing stored in the outbox for {market_key} today")
+    if shard is not None and stored is None:
+        # Shards on separate runners would each generate a different email for their part of
+        # the list, so they only ever send the one stored by a --prepare-only run
+        raise SystemExit(
+            f"--shard: no email stored in the outbox for {market_key} today; run --prepare-only once "
+            "and give every shard job that outbox (.cache)"
+        )
+    return stored
+
+
+def store_prepared(outbox: Outbox | None, market_key: str, subject: str, html_body: str, label: str = "") -> None:
+    if outbox is None:
+        raise SystemExit("--prepare-only stores the email in the outbox; unset OUTBOX_DISABLE")
+    outbox.save_message(run_date(), market_key, subject, html_body)
+    with _print_lock:
+        print(f"{label}Stored today's email for {market_key} in the outbox; --shard jobs will send it")
+
+
+def outbox_queue(market_key: str, shard=None) -> str:
+    # Each shard drains its own queue, so processes sharing an outbox never pick the same rows
+    return market_key if shard is None else f"{market_key}#shard{shard[0]}/{shard[1]}"
+
+
+def deliver(
+    outbox: Outbox | None,
+    market_key: str,
+    subject: str,
+    html_body: str,
+    recipients: Iterable[str],
+    label: str = "",
+    profiles: ProfileStore | None = None,
+    shard=None,
+    day: str | None = None,
+) -> int:
+    # Returns how many recipients were delivered by this call. One provider session serves
+    # every batch, so SMTP connections (and their logins) are reused from batch to batch.
+    from email_providers import from_header, open_sender
+    from recipients import iter_chunks
+
+    from_address, from_name = _sender()
+    personalizer = None
+    if profiles is not None:
+        from personalize import Personalizer
+
+        # Compiled once for every batch of this send, which also share one "Generated" time
+        personalizer = Personalizer(
+            subject=subject,
+            html_body=html_body,
+            from_header=from_header(from_address, from_name),
+            profiles=profiles,
+        )
+    with open_sender(
+        subject=subject, html_body=html_body, from_address=from_address, from_name=from_name, personalizer=personalizer
+    ) as sender:
+
+        def send_batch(batch: List[str]):
+            try:
+                report = sender.send(batch)
+            except Exception:
+                METRICS.incr("emails_failed", len(batch), market=market_key)
+                raise
+            with _print_lock:
+                print(f"{label}{sender.label} delivery: {report.summary()}")
+            METRICS.observe("send_latency_seconds", report.latencies.values(), market=market_key)
+            METRICS.incr("emails_sent", len(report.sent), market=market_key)
+            METRICS.incr("emails_failed", len(report.failed), market=market_key)
+            return report
+
+        # Defaults to what the provider sends best in one go (SendGrid: a chunk per request in flight)
+        batch_size = get_int("OUTBOX_BATCH", sender.batch_size)
+        if outbox is None:
+            # Sent batch by batch as the list streams in; failures are raised once all were tried
+            sent = 0
+            failed: Dict[str, str] = {}
+            with METRICS.span("deliver", market=market_key):
+                for batch in iter_chunks(recipients, batch_size):
+                    report = send_batch(batch)
+                    sent += len(report.sent)
+                    failed.update(report.failed)
+            if failed:
+                from smtp_delivery import failed_summary
+
+                raise RuntimeError(f"Delivery failed for {len(failed)} recipients: {failed_summary(failed)}")
+            return sent
+
+        day = day or run_date()
+        queue = outbox_queue(market_key, shard)
+        outbox.enqueue(day, market_key, recipients, queue=queue)
+        with METRICS.span("deliver", market=market_key):
+            if outbox.store_addresses:
+                stats = outbox.drain(day, queue, send_batch, batch_size=batch_size)
+            else:
+                # Nothing but keys on disk: the list is read again and matched against the queue
+                stats = outbox.drain_list(day, market_key, queue, recipients, send_batch, batch_size=batch_size)
+    METRICS.gauge("outbox_queue_depth", stats["queue_depth"], market=market_key)
+    METRICS.gauge("outbox_drain_rate", stats["drain_rate"], market=market_key)
+    METRICS.gauge("outbox_exhausted", stats["exhausted"], market=market_key)
+    with _print_lock:
+        print(
+            f"{label}Outbox: {stats['delivered_now']} delivered now ({stats['drain_rate']} msgs/sec), "
+            f"{stats['delivered']} delivered today, queue depth {stats['queue_depth']}"
+        )
+        if stats["exhausted"]:
+            # Reported, not raised: no rerun would attempt these again today
+            print(
+                f"{label}Outbox: {stats['exhausted']} recipients gave up after {outbox.max_attempts} attempts "
+                "(see last_error in the outbox)"
+            )
+    if stats["queue_depth"]:
+        raise RuntimeError(
+            f"{stats['queue_depth']} recipients still undelivered; rerun with --resume to retry them "
+            f"(up to OUTBOX_MAX_ATTEMPTS={outbox.max_attempts} attempts each)"
+        )
+    return stats["delivered_now"]
+
+
+_print_lock = threading.Lock()
+
+
+def run_market(
+    market: dict,
+    news_context: str,
+    recipients: Iterable[str],
+    dry_run: bool,
+    replay: bool = False,
+    outbox: Outbox | None = None,
+    resume: bool = False,
+    profiles: ProfileStore | None = None,
+    shard=None,
+    prepare_only: bool = False,
+) -> int:
+    # Returns how many recipients were delivered
+    key = market_outbox_key(market)
+    stored = stored_body(outbox, key, resume, shard)
+    if stored is not None:
+        # Today's body is already final, and may have reached part of the list
+        subject, body_with_disclaimer = stored["subject"], stored["html_body"]
+        with _print_lock:
+            print(f"[{market['name']}] Using today's stored message from the outbox")
+    else:
+        focus = market.get("focus") or ""
+        subject = build_email_subject(market.get("subject_prefix"))
+        with METRICS.span("generate", market=market["name"]):
+            body = call_openai(
+                news_context=build_market_context(news_context, focus),
+                focus=focus,
+                system_msg=market.get("system_instructions"),
+                prompt_body=market.get("prompt_body"),
+                replay=replay,
+                label=f"[{market['name']}] ",
+            )
+        body_with_disclaimer = _inject_disclaimer(body)
+
+    if dry_run:
+        with _print_lock:
+            print(f"[{market['name']}] SUBJECT: {subject}")
+            print(f"[{market['name']}] RECIPIENTS:", ", ".join(recipients))
+            print(body_with_disclaimer)
+        return 0
+
+    if prepare_only:
+        if stored is None:
+            store_prepared(outbox, key, subject, body_with_disclaimer, label=f"[{market['name']}] ")
+        return 0
+    if outbox is not None and stored is None:
+        stored = outbox.save_message(run_date(), key, subject, body_with_disclaimer)
+        subject, body_with_disclaimer = stored["subject"], stored["html_body"]
+    return deliver(
+        outbox,
+        key,
+        subject,
+        body_with_disclaimer,
+        recipients,
+        label=f"[{market['name']}] ",
+        profiles=profiles,
+        shard=shard,
+    )
+
+
+def run_markets(args: argparse.Namespace) -> None:
+    markets = select_markets(args.markets, args.markets_config)
+    if not args.dry_run:
+        _sender()
+    outbox = open_outbox()
+    profiles = load_profiles([args.recipients] + [m.get("recipients_file") for m in markets], args.shard)
+
+    targets = []
+    failed: List[str] = []
+    fallback: RecipientStream | None = None
+    for market in markets:
+        if args.resume or args.prepare_only:
+            # Resuming only drains rows queued by the original run; preparing sends nothing
+            targets.append((market, []))
+            continue
+        try:
+            recipients = market_recipients(market, args.shard)
+        except ValueError as exc:
+            # Skipped rather than sent to the shared list; the other markets still go out
+            failed.append(market["name"])
+            print(f"[{market['name']}] skipped: {exc}")
+            continue
+        if recipients is None:
+            fallback = fallback if fallback is not None else load_recipients(args)
+            recipients = fallback
+        targets.append((market, for_market(recipients, market["name"], profiles)))
+
+    if not targets:
+        raise SystemExit(f"Markets failed: {', '.join(failed)}")
+
+    # One fetch shared by every market; generation and delivery then run side by side
+    pending = [m for m, _ in targets if outbox is None or outbox.get_message(run_date(), market_outbox_key(m)) is None]
+    news_context = fetch_news_context(args) if pending and not args.resume else ""
+
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="market") as pool:
+        futures = {
+            pool.submit(
+                run_market,
+                market,
+                news_context,
+                recipients,
+                args.dry_run,
+                args.replay,
+                outbox,
+                args.resume,
+                profiles,
+                args.shard,
+                args.prepare_only,
+            ): (market, recipients)
+            for market, recipients in targets
+        }
+        for fut in as_completed(futures):
+            market, recipients = futures[fut]
+            try:
+                sent = fut.result()
+            except (Exception, SystemExit) as exc:
+                failed.append(market["name"])
+                with _print_lock:
+                    print(f"[{market['name']}] failed: {exc}")
+                continue
+            if not args.dry_run and not args.prepare_only and outbox is None:
+                with _print_lock:
+                    print(f"[{market['name']}] Sent {sent} emails")
+
+    if failed:
+        raise SystemExit(f"Markets failed: {', '.join(failed)}")
+
+
+def run_single(args: argparse.Namespace) -> None:
+    recipients = [] if args.resume or args.prepare_only else load_recipients(args)
+
+    subject_prefix = args.subject_prefix or os.getenv("SUBJECT_PREFIX", "").strip() or None
+    market_key = outbox_key(os.getenv("FOCUS_MARKET"))
+    outbox = open_outbox()
+    profiles = load_profiles([args.recipients], args.shard)
+
+    stored = stored_body(outbox, market_key, args.resume, args.shard)
+    if stored is not None:
+        print("Using today's stored message from the outbox")
+        subject, body_with_disclaimer = stored["subject"], stored["html_body"]
+    else:
+        subject = build_email_subject(subject_prefix)
+        news_ctx = build_market_context(fetch_news_context(args))
+        with METRICS.span("generate", market=market_key):
+            body = call_openai(news_context=news_ctx, replay=args.replay)
+        body_with_disclaimer = _inject_disclaimer(body)
 
     if args.dry_run:
         print(f"SUBJECT: {subject}")
@@ -132,22 +662,213 @@ def main() -> None:
         print(body_with_disclaimer)
         return
 
-    from_address = os.getenv("EMAIL_FROM_ADDRESS") or os.getenv("GMAIL_USERNAME")
-    if not from_address:
-        raise SystemExit("EMAIL_FROM_ADDRESS or GMAIL_USERNAME must be set for sender address")
+    if args.prepare_only:
+        if stored is None:
+            store_prepared(outbox, market_key, subject, body_with_disclaimer)
+        return
+    if outbox is not None and stored is None:
+        stored = outbox.save_message(run_date(), market_key, subject, body_with_disclaimer)
+        subject, body_with_disclaimer = stored["subject"], stored["html_body"]
+    sent = deliver(outbox, market_key, subject, body_with_disclaimer, recipients, profiles=profiles, shard=args.shard)
+
+    if outbox is None:
+        print(f"Sent {sent} emails")
+
+
+def run_daemon(args: argparse.Namespace) -> None:
+    # One long-lived process for every market: each email is generated ahead of the market's
+    # local send time and delivered from the ready message at that instant (see scheduler.py)
+    import signal
+
+    from scheduler import Scheduler
+
+    if args.resume:
+        raise SystemExit("--resume cannot be combined with --daemon")
+    markets = select_markets(args.markets or ",".join(load_market_config(args.markets_config)), args.markets_config)
+    if not args.dry_run:
+        _sender()
+    outbox = open_outbox()
+    profiles = load_profiles([args.recipients] + [m.get("recipients_file") for m in markets], args.shard)
+
+    targets: Dict[str, RecipientStream] = {}
+    skipped: List[str] = []
+    fallback: RecipientStream | None = None
+    for market in markets:
+        try:
+            recipients = market_recipients(market, args.shard)
+        except ValueError as exc:
+            skipped.append(market["name"])
+            print(f"[{market['name']}] skipped: {exc}")
+            continue
+        if recipients is None:
+            fallback = fallback if fallback is not None else load_recipients(args)
+            recipients = fallback
+        targets[market["name"]] = for_market(recipients, market["name"], profiles)
+    markets = [m for m in markets if m["name"] in targets]
+    if not markets:
+        raise SystemExit(f"Markets failed: {', '.join(skipped)}")
+
+    fetch_lock = threading.Lock()
+    report_lock = threading.Lock()
+
+    def fetch() -> str:
+        # Markets preparing at the same moment fetch one after the other, so all but the first
+        # are served from the feed cache
+        with fetch_lock:
+            return fetch_news_context(args)
+
+    def generate(market: dict, day: str, news_context: str) -> dict:
+        focus = market.get("focus") or ""
+        with METRICS.span("generate", market=market["name"]):
+            body = call_openai(
+                news_context=build_market_context(news_context, focus),
+                focus=focus,
+                system_msg=market.get("system_instructions"),
+                prompt_body=market.get("prompt_body"),
+                replay=args.replay,
+                day=day,
+                label=f"[{market['name']}] ",
+            )
+        subject = build_email_subject(market.get("subject_prefix"), day)
+        return {"subject": subject, "html_body": _inject_disclaimer(body), "news": news_context}
+
+    def prepare(market: dict, day: str) -> dict:
+        name, key = market["name"], market_outbox_key(market)
+        stored = outbox.get_message(day, key) if outbox is not None else None
+        if stored is not None:
+            # Restarted after this day's body went out: only what is still queued gets sent
+            return {**stored, "stored": True}
+        message = generate(market, day, fetch())
+        if outbox is not None and not args.dry_run:
+            # Queued ahead as well, so the send itself only drains the outbox
+            outbox.enqueue(day, key, targets[name], queue=outbox_queue(key, args.shard))
+        return message
+
+    def refresh(market: dict, day: str, prepared: dict) -> dict | None:
+        if prepared.get("stored") or args.no_news or args.replay:
+            return None
+        news_context = fetch()
+        if news_context == prepared["news"]:
+            print(f"[{market['name']}] No new articles since preparing")
+            return None
+        print(f"[{market['name']}] News changed since preparing; regenerating")
+        return generate(market, day, news_context)
+
+    def send(market: dict, day: str, message: dict) -> int:
+        name, key = market["name"], market_outbox_key(market)
+        if args.dry_run:
+            with _print_lock:
+                print(f"[{name}] SUBJECT: {message['subject']}")
+                print(message["html_body"])
+            return 0
+        if outbox is None:
+            return deliver(
+                None, key, message["subject"], message["html_body"], targets[name], label=f"[{name}] ", profiles=profiles
+            )
+        stored = outbox.save_message(day, key, message["subject"], message["html_body"])
+        return deliver(
+            outbox,
+            key,
+            stored["subject"],
+            stored["html_body"],
+            # Queued when prepared; an outbox without addresses needs the list again to send
+            [] if outbox.store_addresses else targets[name],
+            label=f"[{name}] ",
+            profiles=profiles,
+            shard=args.shard,
+            day=day,
+        )
+
+    def report(market: dict, day: str, status: str) -> None:
+        # Each report covers everything since the previous one, including this send's span, and
+        # the collector starts afresh, so a long-running daemon's metrics do not grow without bound
+        with report_lock:
+            write_run_report(args, status, METRICS.rotate(), market=market["name"], day=day)
+
+    try:
+        scheduler = Scheduler(markets, prepare, refresh, send, once=args.once, report=report)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from None
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("Stopped")
+    if skipped or scheduler.failed:
+        raise SystemExit(f"Markets failed: {', '.join(skipped + scheduler.failed)}")
+
+
+def write_run_report(
+    args: argparse.Namespace,
+    status: str,
+    metrics: Metrics | None = None,
+    market: str | None = None,
+    day: str | None = None,
+) -> None:
+    metrics = metrics or METRICS
+    snapshot = metrics.snapshot()
+    stages: dict = {}
+    for span in snapshot["spans"]:
+        # Summed across markets, so with --markets this can exceed the wall time
+        if span["name"] in {"fetch", "generate", "deliver"}:
+            stages[span["name"]] = stages.get(span["name"], 0.0) + span["sum"]
+    tokens = {c["name"]: c["value"] for c in snapshot["counters"] if c["name"].endswith("_tokens")}
+    if stages:
+        print("Stages: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages.items()))
+    if tokens:
+        print(f"Tokens: {tokens.get('prompt_tokens', 0):g} prompt, {tokens.get('completion_tokens', 0):g} completion")
+
+    path = args.report or os.getenv("RUN_REPORT_PATH") or ".cache/run_report.json"
+    prometheus = args.prometheus or os.getenv("METRICS_PROM_PATH")
+    extra = {"markets": args.markets}
+    if market:
+        # The daemon's per-send reports sit side by side: run_report-usa-2026-10-17.json, and one
+        # Prometheus file per market that each send replaces
+        path = _suffixed(path, f"-{market}-{day}")
+        prometheus = prometheus and _suffixed(prometheus, f"-{market}")
+        extra = {"markets": market, "day": day}
+    try:
+        metrics.write_json(path, status=status, dry_run=args.dry_run, **extra)
+        if prometheus:
+            metrics.write_prometheus(prometheus)
+    except OSError as exc:
+        # Reporting must never turn a successful send into a failed run
+        print(f"Could not write run report: {exc}")
+        return
+    print(f"Run report: {path}" + (f" (Prometheus: {prometheus})" if prometheus else ""))
 
-    from_name = os.getenv("EMAIL_FROM_NAME", "Market Daily TL;DR")
 
-    send_email(
-        subject=subject,
-        html_body=body_with_disclaimer,
-        recipients=recipients,
-        from_address=from_address,
-        from_name=from_name,
-    )
+def _suffixed(path: str, suffix: str) -> str:
+    p = Path(path)
+    return str(p.with_name(f"{p.stem}{suffix}{p.suffix}"))
 
-    print(f"Sent {len(recipients)} emails: {', '.join(recipients)}")
+
+def main() -> None:
+    args = parse_args()
+    if args.once and not args.daemon:
+        raise SystemExit("--once only applies to --daemon")
+    if args.prepare_only and (args.shard or args.resume or args.daemon):
+        raise SystemExit("--prepare-only generates the email for all shards; run it without --shard/--resume/--daemon")
+
+    from dotenv import load_dotenv
+
+    load_dotenv(override=False)
+    METRICS.reset()
+    status = "failed"
+    try:
+        with METRICS.span("run"):
+            if args.daemon:
+                run_daemon(args)
+            elif args.markets:
+                run_markets(args)
+            else:
+                run_single(args)
+        status = "ok"
+    finally:
+        # The daemon reports after every send; a clean exit leaves the last of those in place
+        if not (args.daemon and status == "ok"):
+            write_run_report(args, status)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,64 +1,224 @@
 from __future__ import annotations
 
 import os
-import re
-import smtplib
-import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from typing import Iterable
+from functools import lru_cache
+from typing import Callable, Iterable, List
 
-try:
-    from sendgrid import SendGridAPIClient
-    from sendgrid.helpers.mail import Mail, Email, To, Content
-except Exception:  # pragma: no cover - optional dependency
-    SendGridAPIClient = None  # type: ignore
-    Mail = Email = To = Content = None  # type: ignore
+from env import get_bool, get_int
+from mime_render import MessageTemplate, html_to_text
+from personalize import Personalizer
+from sendgrid_delivery import MAX_PERSONALIZATIONS, deliver_bulk
+from smtp_delivery import DeliveryReport, SmtpDeliveryEngine, failed_summary
 
 
-def _get_bool_env(name: str, default: bool = False) -> bool:
-    val = os.getenv(name)
-    if val is None:
-        return default
-    return str(val).strip().lower() in {"1", "true", "yes", "y"}
+@lru_cache(maxsize=1)
+def _sendgrid_client_class():
+    # The sendgrid helper tree is only imported when SendGrid is actually the provider
+    try:
+        from sendgrid import SendGridAPIClient
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return SendGridAPIClient
 
 
-def _html_to_text(html: str) -> str:
-    # naive HTML to text fallback
-    text = re.sub(r"<\s*br\s*/?>", "\n", html, flags=re.IGNORECASE)
-    text = re.sub(r"<\s*/p\s*>", "\n\n", text, flags=re.IGNORECASE)
-    text = re.sub(r"<[^>]+>", "", text)
-    return re.sub(r"\n{3,}", "\n\n", text).strip()
+def from_header(from_address: str, from_name: str | None = None) -> str:
+    return f"{from_name} <{from_address}>" if from_name else from_address
 
 
-def send_via_sendgrid(
+def _personalizer(subject: str, html_body: str, from_header: str, profiles: dict | None) -> Personalizer | None:
+    if profiles is None:
+        return None
+    return Personalizer(subject=subject, html_body=html_body, from_header=from_header, profiles=profiles)
+
+
+class SendGridSender:
+    # One SendGrid session for a whole send: the client and the message content are set up
+    # once, and each send() posts its recipients in chunks with requests in flight side by side
+    label = "SendGrid"
+
+    def __init__(
+        self,
+        *,
+        subject: str,
+        html_body: str,
+        from_address: str,
+        from_name: str | None = None,
+        personalizer: Personalizer | None = None,
+    ) -> None:
+        api_key = os.getenv("SENDGRID_API_KEY")
+        if not api_key:
+            raise RuntimeError("SENDGRID_API_KEY not set")
+
+        SendGridAPIClient = _sendgrid_client_class()
+        if SendGridAPIClient is None:
+            raise RuntimeError("sendgrid package not available. Install it from requirements.txt")
+
+        self.client = SendGridAPIClient(api_key, host=os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com"))
+        self.subject = subject
+        self.from_address = from_address
+        self.from_name = from_name
+        if personalizer is not None:
+            # The shell is rendered once with -slot- tokens that SendGrid fills in per recipient
+            self.text_body, self.html_body, self.personalization = personalizer.sendgrid_content()
+        else:
+            self.text_body, self.html_body, self.personalization = html_to_text(html_body) or subject, html_body, None
+        self.chunk_size = get_int("SENDGRID_CHUNK_SIZE", 1000)
+        self.concurrency = get_int("SENDGRID_CONCURRENCY", 4)
+        self.retries = get_int("SENDGRID_RETRIES", 4)
+        # Batches big enough to fill every request in flight
+        self.batch_size = max(1, min(self.chunk_size, MAX_PERSONALIZATIONS)) * max(1, self.concurrency)
+
+    def _post(self, payload: dict):
+        response = self.client.client.mail.send.post(request_body=payload)
+        return response.status_code, dict(response.headers or {}), response.body
+
+    def send(self, recipients: Iterable[str]) -> DeliveryReport:
+        return deliver_bulk(
+            self._post,
+            subject=self.subject,
+            html_body=self.html_body,
+            # Plain first, then HTML
+            text_body=self.text_body,
+            recipients=list(recipients),
+            from_address=self.from_address,
+            from_name=self.from_name,
+            chunk_size=self.chunk_size,
+            concurrency=self.concurrency,
+            retries=self.retries,
+            personalization=self.personalization,
+        )
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "SendGridSender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class GmailSender:
+    # One SMTP session for a whole send: the workers' connections are opened on first use and
+    # kept across every send() until close(), so batches after the first need no new login
+    label = "SMTP"
+    batch_size = 500
+
+    def __init__(
+        self,
+        *,
+        subject: str,
+        html_body: str,
+        from_address: str,
+        from_name: str | None = None,
+        personalizer: Personalizer | None = None,
+    ) -> None:
+        username = os.getenv("GMAIL_USERNAME")
+        password = os.getenv("GMAIL_APP_PASSWORD")
+        if not username or not password:
+            raise RuntimeError("GMAIL_USERNAME or GMAIL_APP_PASSWORD not set")
+
+        host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        port = get_int("SMTP_PORT", 587)
+
+        # Rendered once; each recipient only gets their own To header stamped on, so addresses
+        # are never exposed to each other. With a personalizer, each recipient's copy is filled
+        # in from its pre-compiled shell instead.
+        self.personalizer = personalizer
+        self.template: MessageTemplate | None = None
+        if personalizer is None:
+            self.template = MessageTemplate(
+                subject=subject, html_body=html_body, from_header=from_header(from_address, from_name)
+            )
+
+        self.engine = SmtpDeliveryEngine(
+            host=host,
+            port=port,
+            username=username,
+            password=password,
+            workers=get_int("SMTP_WORKERS", 4),
+            rate_per_minute=get_int("SMTP_RATE_PER_MINUTE", 0),
+            starttls=get_bool("SMTP_STARTTLS", True),
+        )
+        self.engine.start(from_address=from_address)
+
+    def _render(self, recipients: List[str]) -> Callable[[str], bytes]:
+        if self.personalizer is None:
+            return self.template.render  # type: ignore[union-attr]
+        personalizer = self.personalizer
+        # Each batch is rendered in a single pass ahead of the SMTP workers
+        try:
+            rendered = dict(zip(recipients, personalizer.render_batch(recipients)))
+        except ValueError:
+            # A malformed address rejects the whole pass; render one at a time so only it fails
+            rendered = {}
+
+        def render(recipient: str) -> bytes:
+            message = rendered.get(recipient)
+            return message if message is not None else personalizer.render(recipient)
+
+        return render
+
+    def send(self, recipients: Iterable[str]) -> DeliveryReport:
+        recipients = list(recipients)
+        return self.engine.send(recipients, self._render(recipients))
+
+    def close(self) -> None:
+        self.engine.close()
+
+    def __enter__(self) -> "GmailSender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_sender(
     *,
     subject: str,
     html_body: str,
-    recipients: list[str],
     from_address: str,
     from_name: str | None = None,
-) -> None:
-    api_key = os.getenv("SENDGRID_API_KEY")
-    if not api_key:
-        raise RuntimeError("SENDGRID_API_KEY not set")
+    personalizer: Personalizer | None = None,
+) -> GmailSender | SendGridSender:
+    # A session that delivers one email in as many send() batches as needed; close it (or use
+    # it as a context manager) when done
+    kwargs = dict(
+        subject=subject, html_body=html_body, from_address=from_address, from_name=from_name, personalizer=personalizer
+    )
+    # Prefer Gmail minimal config
+    if os.getenv("GMAIL_USERNAME") and os.getenv("GMAIL_APP_PASSWORD"):
+        return GmailSender(**kwargs)
 
-    if SendGridAPIClient is None:
-        raise RuntimeError("sendgrid package not available. Install it from requirements.txt")
+    # Optional SendGrid fallback if configured
+    if os.getenv("SENDGRID_API_KEY"):
+        return SendGridSender(**kwargs)
 
-    sg = SendGridAPIClient(api_key)
-    from_email = Email(from_address, from_name) if from_name else Email(from_address)
+    raise RuntimeError("No email provider configured. Set GMAIL_USERNAME and GMAIL_APP_PASSWORD in environment.")
 
-    message = Mail(from_email=from_email, subject=subject)
-    # Add plain first, then HTML
-    message.add_content(Content("text/plain", _html_to_text(html_body) or subject))
-    message.add_content(Content("text/html", html_body))
-    for addr in recipients:
-        message.add_to(To(email=addr))
 
-    response = sg.client.mail.send.post(request_body=message.get())
-    if response.status_code >= 300:
-        raise RuntimeError(f"SendGrid error: {response.status_code} {response.body}")
+def send_via_sendgrid(
+    *,
+    subject: str,
+    html_body: str,
+    recipients: list[str],
+    from_address: str,
+    from_name: str | None = None,
+    raise_on_failure: bool = True,
+    profiles: dict | None = None,
+) -> DeliveryReport:
+    with SendGridSender(
+        subject=subject,
+        html_body=html_body,
+        from_address=from_address,
+        from_name=from_name,
+        personalizer=_personalizer(subject, html_body, from_address, profiles),
+    ) as sender:
+        report = sender.send(recipients)
+    print(f"SendGrid delivery: {report.summary()}")
+    if report.failed and raise_on_failure:
+        raise RuntimeError(f"SendGrid error for {len(report.failed)} recipients: {failed_summary(report.failed)}")
+    return report
 
 
 def send_via_gmail(
@@ -68,31 +228,21 @@ def send_via_gmail(
     recipients: Iterable[str],
     from_address: str,
     from_name: str | None = None,
-) -> None:
-    username = os.getenv("GMAIL_USERNAME")
-    password = os.getenv("GMAIL_APP_PASSWORD")
-    if not username or not password:
-        raise RuntimeError("GMAIL_USERNAME or GMAIL_APP_PASSWORD not set")
-
-    host = "smtp.gmail.com"
-    port = 587
-
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = f"{from_name} <{from_address}>" if from_name else from_address
-    msg["To"] = ", ".join(recipients)
-
-    # Plain first, then HTML
-    part_plain = MIMEText(_html_to_text(html_body) or subject, "plain", _charset="utf-8")
-    part_html = MIMEText(html_body, "html", _charset="utf-8")
-    msg.attach(part_plain)
-    msg.attach(part_html)
-
-    context = ssl.create_default_context()
-    with smtplib.SMTP(host, port) as server:
-        server.starttls(context=context)
-        server.login(username, password)
-        server.sendmail(from_address, list(recipients), msg.as_string())
+    raise_on_failure: bool = True,
+    profiles: dict | None = None,
+) -> DeliveryReport:
+    with GmailSender(
+        subject=subject,
+        html_body=html_body,
+        from_address=from_address,
+        from_name=from_name,
+        personalizer=_personalizer(subject, html_body, from_header(from_address, from_name), profiles),
+    ) as sender:
+        report = sender.send(recipients)
+    print(f"SMTP delivery: {report.summary()}")
+    if report.failed and raise_on_failure:
+        raise RuntimeError(f"SMTP delivery failed for {len(report.failed)} recipients: {failed_summary(report.failed)}")
+    return report
 
 
 def send_email(
@@ -102,27 +252,31 @@ def send_email(
     recipients: list[str],
     from_address: str,
     from_name: str | None = None,
-) -> None:
+    raise_on_failure: bool = True,
+    profiles: dict | None = None,
+) -> DeliveryReport:
     # Prefer Gmail minimal config
     if os.getenv("GMAIL_USERNAME") and os.getenv("GMAIL_APP_PASSWORD"):
-        send_via_gmail(
+        return send_via_gmail(
             subject=subject,
             html_body=html_body,
             recipients=recipients,
             from_address=from_address,
             from_name=from_name,
+            raise_on_failure=raise_on_failure,
+            profiles=profiles,
         )
-        return
 
     # Optional SendGrid fallback if configured
     if os.getenv("SENDGRID_API_KEY"):
-        send_via_sendgrid(
+        return send_via_sendgrid(
             subject=subject,
             html_body=html_body,
             recipients=recipients,
             from_address=from_address,
             from_name=from_name,
+            raise_on_failure=raise_on_failure,
+            profiles=profiles,
         )
-        return
 
-    raise RuntimeError("No email provider configured. Set GMAIL_USERNAME and GMAIL_APP_PASSWORD in environment.") 
\ No newline at end of file
+    raise RuntimeError("No email provider configured. Set GMAIL_USERNAME and GMAIL_APP_PASSWORD in environment.")
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import os
+
+# Values accepted as "on" by the boolean switches (SMTP_STARTTLS, OUTBOX_DISABLE, ...)
+TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+
+def get_int(name: str, default: int) -> int:
+    # Unset or unparsable values fall back to the default
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def get_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def get_bool(name: str, default: bool = False) -> bool:
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return str(val).strip().lower() in TRUTHY
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from env import get_float
+
+
+class FeedCache:
+    # On-disk cache of parsed feed/API responses keyed by URL. Each entry keeps the
+    # validators (ETag / Last-Modified) so callers can revalidate with a conditional GET.
+    #
+    # - fresh: younger than ttl, served without any request
+    # - stale: older than ttl but younger than stale_ttl, revalidated, and served as-is
+    #   if the revalidation does not land before the fetch deadline
+    # - expired: older than stale_ttl, removed on eviction
+
+    def __init__(
+        self,
+        directory: str | os.PathLike | None = None,
+        ttl: float | None = None,
+        stale_ttl: float | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        self.directory = Path(directory or os.getenv("FEED_CACHE_DIR", ".cache/feeds"))
+        self.ttl = ttl if ttl is not None else get_float("FEED_CACHE_TTL", 600.0)
+        self.stale_ttl = stale_ttl if stale_ttl is not None else get_float("FEED_CACHE_STALE_TTL", 86400.0)
+        self.max_bytes = max_bytes if max_bytes is not None else int(get_float("FEED_CACHE_MAX_BYTES", 20e6))
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "revalidated": 0,
+            "stale_served": 0,
+            "misses": 0,
+            "bytes_fetched": 0,
+            "bytes_saved": 0,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return entry
+
+    def put(
+        self,
+        key: str,
+        entries: List[dict],
+        *,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        body_bytes: int = 0,
+    ) -> dict:
+        entry = {
+            "key": key,
+            "fetched_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "body_bytes": body_bytes,
+            "entries": entries,
+        }
+        self._write(key, entry)
+        return entry
+
+    def touch(self, key: str, entry: dict) -> None:
+        entry["fetched_at"] = time.time()
+        self._write(key, entry)
+
+    def _write(self, key: str, entry: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def age(self, entry: dict) -> float:
+        return time.time() - float(entry.get("fetched_at") or 0)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return self.age(entry) < self.ttl
+
+    def is_usable_stale(self, entry: dict) -> bool:
+        return self.age(entry) < self.stale_ttl
+
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if not entry:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, outcome: str, *, bytes_fetched: int = 0, bytes_saved: int = 0) -> None:
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats["bytes_fetched"] += bytes_fetched
+            self._stats["bytes_saved"] += bytes_saved
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def evict(self) -> int:
+        # Drop expired entries, then the oldest ones until the directory fits max_bytes.
+        if not self.directory.exists():
+            return 0
+        removed = 0
+        now = time.time()
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime >= self.stale_ttl:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
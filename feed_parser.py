@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Iterable, Iterator, List
+from xml.etree.ElementTree import Element, ParseError, XMLPullParser
+
+ENTRY_TAGS = {"item", "entry"}
+PUBLISHED_TAGS = ("pubDate", "published", "updated", "date")
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _entry_to_dict(elem: Element) -> dict:
+    title = ""
+    link = ""
+    guid = ""
+    dates = {}
+    for child in elem:
+        name = _local(child.tag)
+        if name == "title" and not title:
+            title = "".join(child.itertext()).strip()
+        elif name == "link" and not link:
+            # RSS puts the URL in the text, Atom in href (prefer rel="alternate")
+            href = child.get("href")
+            if href is None:
+                link = (child.text or "").strip()
+            elif child.get("rel", "alternate") == "alternate":
+                link = href.strip()
+        elif name in ("guid", "id") and not guid:
+            guid = (child.text or "").strip()
+        elif name in PUBLISHED_TAGS and name not in dates:
+            dates[name] = (child.text or "").strip()
+    published = next((dates[name] for name in PUBLISHED_TAGS if dates.get(name)), "")
+    return {"title": title or "Untitled", "link": link, "published": published, "guid": guid}
+
+
+def iter_entries(chunks: Iterable[bytes]) -> Iterator[dict]:
+    # Yields RSS <item> / Atom <entry> elements as they complete, so the caller can stop
+    # pulling chunks (and reading the socket) as soon as it has enough. Raises ParseError
+    # on malformed XML.
+    parser = XMLPullParser(events=("end",))
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            if _local(elem.tag) in ENTRY_TAGS:
+                yield _entry_to_dict(elem)
+                elem.clear()
+    parser.close()
+    for _, elem in parser.read_events():
+        if _local(elem.tag) in ENTRY_TAGS:
+            yield _entry_to_dict(elem)
+
+
+@lru_cache(maxsize=1)
+def _feedparser():
+    # Imported on first use: only the fallback and NEWS_FEED_PARSER=feedparser need it
+    try:
+        import feedparser  # type: ignore
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return feedparser
+
+
+def feedparser_available() -> bool:
+    return _feedparser() is not None
+
+
+def parse_with_feedparser(data: bytes) -> List[dict]:
+    feedparser = _feedparser()
+    if feedparser is None:
+        return []
+    parsed = feedparser.parse(data)
+    return [
+        {
+            "title": getattr(entry, "title", None) or "Untitled",
+            "link": getattr(entry, "link", None) or "",
+            "published": getattr(entry, "published", getattr(entry, "updated", "")),
+            "guid": getattr(entry, "id", None) or "",
+        }
+        for entry in parsed.entries
+    ]
+
+
+def parse_feed(chunks: Iterable[bytes], limit: int | None = None) -> List[dict]:
+    # Streams up to `limit` entries out of `chunks`. Malformed feeds, or documents the
+    # pull parser finds no entries in, are re-parsed in full with feedparser.
+    consumed: List[bytes] = []
+    it = iter(chunks)
+
+    def recording() -> Iterator[bytes]:
+        for chunk in it:
+            consumed.append(chunk)
+            yield chunk
+
+    entries: List[dict] = []
+    try:
+        for entry in iter_entries(recording()):
+            entries.append(entry)
+            if limit is not None and len(entries) >= limit:
+                return entries
+    except ParseError:
+        entries = []
+    if entries:
+        return entries
+
+    data = b"".join(consumed) + b"".join(it)
+    entries = parse_with_feedparser(data)
+    return entries[:limit] if limit is not None else entries
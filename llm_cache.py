@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from env import get_float
+
+
+def response_key(model: str, system_msg: str, user_msg: str, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps([model, system_msg, user_msg, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def replay_key(model: str, system_msg: str, focus: str, day: str | None = None) -> str:
+    # Identifies "today's email for this market/model" independent of the exact news context,
+    # so --replay still finds the body after the feeds have moved on.
+    payload = json.dumps([model, system_msg, focus, day or date.today().isoformat()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _run_day(day: str | None) -> str:
+    # `day` is the run date (YYYY-MM-DD) the entry belongs to, e.g. a market's local date
+    return day or date.today().isoformat()
+
+
+def _oldest_kept(day: str | None) -> str:
+    # Markets' local dates run up to a day behind (or ahead of) the host's, so eviction keeps
+    # the day before as well
+    run_day = date.fromisoformat(day) if day else date.today()
+    return (min(run_day, date.today()) - timedelta(days=1)).isoformat()
+
+
+class FileResponseCache:
+    # One JSON file per key; entries are valid for the run day they were written for.
+
+    def __init__(self, directory: str | os.PathLike, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _read(self, path: Path) -> Optional[dict]:
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str, day: str | None = None) -> Optional[dict]:
+        entry = self._read(self._path(key))
+        if entry is None or entry.get("day") != _run_day(day):
+            return None
+        return entry
+
+    def get_latest(self, replay: str) -> Optional[dict]:
+        if not self.directory.exists():
+            return None
+        matches: List[dict] = []
+        for path in self.directory.glob("*.json"):
+            entry = self._read(path)
+            if entry and entry.get("replay_key") == replay:
+                matches.append(entry)
+        return max(matches, key=lambda e: e.get("created_at", 0), default=None)
+
+    def put(self, key: str, replay: str, content: str, meta: dict, day: str | None = None) -> None:
+        entry = {
+            "key": key,
+            "replay_key": replay,
+            "day": _run_day(day),
+            "created_at": time.time(),
+            "content": content,
+            "meta": meta,
+        }
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+
+    def evict(self, day: str | None = None) -> int:
+        if not self.directory.exists():
+            return 0
+        oldest = _oldest_kept(day)
+        removed = 0
+        files = []
+        for path in self.directory.glob("*.json"):
+            entry = self._read(path)
+            if entry is None or str(entry.get("day", "")) < oldest:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            files.append((entry.get("created_at", 0), path.stat().st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+class SqliteResponseCache:
+    # Same contract as FileResponseCache, in one SQLite file.
+
+    def __init__(self, path: str | os.PathLike, max_bytes: int) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, replay_key TEXT NOT NULL, day TEXT NOT NULL,"
+                " created_at REAL NOT NULL, content TEXT NOT NULL, meta TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_replay ON responses (replay_key, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(row) -> Optional[dict]:
+        if row is None:
+            return None
+        key, replay, day, created_at, content, meta = row
+        return {
+            "key": key,
+            "replay_key": replay,
+            "day": day,
+            "created_at": created_at,
+            "content": content,
+            "meta": json.loads(meta),
+        }
+
+    def get(self, key: str, day: str | None = None) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT key, replay_key, day, created_at, content, meta FROM responses WHERE key = ? AND day = ?",
+                (key, _run_day(day)),
+            ).fetchone()
+        return self._row(row)
+
+    def get_latest(self, replay: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT key, replay_key, day, created_at, content, meta FROM responses"
+                " WHERE replay_key = ? ORDER BY created_at DESC LIMIT 1",
+                (replay,),
+            ).fetchone()
+        return self._row(row)
+
+    def put(self, key: str, replay: str, content: str, meta: dict, day: str | None = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, replay, _run_day(day), time.time(), content, json.dumps(meta)),
+            )
+
+    def evict(self, day: str | None = None) -> int:
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM responses WHERE day < ?", (_oldest_kept(day),)).rowcount
+            rows = conn.execute(
+                "SELECT key, length(content) + length(meta) FROM responses ORDER BY created_at DESC"
+            ).fetchall()
+            total = 0
+            stale = []
+            for key, size in rows:
+                total += size
+                if total > self.max_bytes:
+                    stale.append((key,))
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        return removed + len(stale)
+
+
+def open_response_cache():
+    # LLM_CACHE=file (default) | sqlite | off
+    backend = os.getenv("LLM_CACHE", "file").strip().lower()
+    max_bytes = int(get_float("LLM_CACHE_MAX_BYTES", 5e6))
+    if backend in {"off", "0", "false", "no", "none"}:
+        return None
+    if backend == "sqlite":
+        return SqliteResponseCache(os.getenv("LLM_CACHE_PATH", ".cache/llm.sqlite3"), max_bytes)
+    if backend == "file":
+        return FileResponseCache(os.getenv("LLM_CACHE_PATH", ".cache/llm"), max_bytes)
+    raise SystemExit(f"Unknown LLM_CACHE backend: {backend}")
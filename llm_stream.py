@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from env import get_bool, get_float
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Shared by every LatencyHistory, since concurrent markets each open their own instance
+_HISTORY_LOCK = threading.Lock()
+
+
+class LatencyHistory:
+    # Recent time-to-first-token samples per model, persisted so the hedge threshold adapts
+    # across daily runs.
+
+    def __init__(self, path: str | os.PathLike | None = None, keep: int = 200) -> None:
+        self.path = Path(path or os.getenv("OPENAI_LATENCY_HISTORY", ".cache/llm_latency.json"))
+        self.keep = keep
+
+    def _load(self) -> Dict[str, List[float]]:
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def samples(self, model: str) -> List[float]:
+        return list(self._load().get(model, []))
+
+    def record(self, model: str, ttft: float) -> None:
+        with _HISTORY_LOCK:
+            data = self._load()
+            data[model] = (data.get(model, []) + [round(ttft, 4)])[-self.keep :]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def percentile(self, model: str, pct: float, min_samples: int = 5) -> float | None:
+        values = sorted(self.samples(model))
+        if len(values) < min_samples:
+            return None
+        rank = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+        return values[rank]
+
+
+def stream_completion(
+    client,
+    *,
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    max_tokens: int,
+    first_token: threading.Event | None = None,
+    cancel: threading.Event | None = None,
+) -> Tuple[str, dict]:
+    start = time.monotonic()
+    ttft: float | None = None
+    parts: List[str] = []
+    chunks = 0
+    usage = None
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - start
+                if first_token is not None:
+                    first_token.set()
+            parts.append(delta)
+            chunks += 1
+    finally:
+        close = getattr(stream, "close", None)
+        if callable(close):
+            close()
+
+    total = time.monotonic() - start
+    completion_tokens = getattr(usage, "completion_tokens", None) or chunks
+    generating = total - (ttft or 0.0)
+    stats = {
+        "model": model,
+        "ttft_s": round(ttft if ttft is not None else total, 3),
+        "total_s": round(total, 3),
+        "completion_tokens": completion_tokens,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "tokens_per_s": round(completion_tokens / generating, 1) if generating > 0 else None,
+    }
+    return "".join(parts), stats
+
+
+def _blocking_completion(client, *, model, messages, temperature, max_tokens) -> Tuple[str, dict]:
+    start = time.monotonic()
+    completion = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+    total = time.monotonic() - start
+    usage = getattr(completion, "usage", None)
+    stats = {
+        "model": model,
+        "ttft_s": None,
+        "total_s": round(total, 3),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "tokens_per_s": None,
+    }
+    return completion.choices[0].message.content or "", stats
+
+
+def hedged_completion(
+    client,
+    *,
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    max_tokens: int,
+    history: LatencyHistory,
+    hedge_model: str | None = None,
+) -> Tuple[str, dict]:
+    # Streams the primary request; if no token has arrived by the configured percentile of
+    # past time-to-first-token, fires a second request and keeps whichever finishes first.
+    pct = get_float("OPENAI_HEDGE_PERCENTILE", 95.0)
+    threshold = history.percentile(model, pct)
+    if threshold is None:
+        threshold = get_float("OPENAI_HEDGE_AFTER", 20.0)
+
+    cancel_primary = threading.Event()
+    cancel_hedge = threading.Event()
+    # Set on the primary's first token, and also when it finishes or fails, so a request that
+    # errors at once (e.g. a 401) goes straight to the hedge instead of waiting out the threshold
+    primary_first = threading.Event()
+    primary_failed = threading.Event()
+    kwargs = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    results: "queue.Queue[Tuple[str, object]]" = queue.Queue()
+
+    def run(name: str, run_model: str, **extra) -> None:
+        try:
+            results.put((name, stream_completion(client, model=run_model, **kwargs, **extra)))
+        except BaseException as exc:
+            if name == "primary":
+                primary_failed.set()
+            results.put((name, exc))
+        finally:
+            if name == "primary":
+                primary_first.set()
+
+    # Daemon threads: the losing request may sit in a socket read, and must not hold the
+    # process open once the winner has been returned.
+    start = time.monotonic()
+    threading.Thread(
+        target=run,
+        args=("primary", model),
+        kwargs={"first_token": primary_first, "cancel": cancel_primary},
+        daemon=True,
+    ).start()
+    started = 1
+    hedged = False
+    primary_first.wait(threshold)
+    if not primary_first.is_set() or primary_failed.is_set():
+        threading.Thread(
+            target=run, args=("hedge", hedge_model or model), kwargs={"cancel": cancel_hedge}, daemon=True
+        ).start()
+        started = 2
+        hedged = True
+
+    error: BaseException | None = None
+    for _ in range(started):
+        name, outcome = results.get()
+        if isinstance(outcome, BaseException):
+            error = outcome
+            continue
+        content, stats = outcome  # type: ignore[misc]
+        stats["hedged"] = hedged
+        stats["winner"] = name
+        (cancel_hedge if name == "primary" else cancel_primary).set()
+        if name == "hedge" and not primary_first.is_set():
+            # The slow primary never produced a token; record how long it waited as a lower
+            # bound, or the percentile would only ever see fast requests and keep falling
+            history.record(model, round(time.monotonic() - start, 3))
+        return content, stats
+    raise error  # type: ignore[misc]
+
+
+def complete(client, *, model: str, messages: List[dict], temperature: float, max_tokens: int) -> Tuple[str, dict]:
+    # OPENAI_STREAM (default on) streams and records latency; OPENAI_HEDGE adds hedging.
+    kwargs = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    if not get_bool("OPENAI_STREAM", True):
+        return _blocking_completion(client, **kwargs)
+
+    history = LatencyHistory()
+    if get_bool("OPENAI_HEDGE", False):
+        content, stats = hedged_completion(
+            client, history=history, hedge_model=os.getenv("OPENAI_HEDGE_MODEL") or None, **kwargs
+        )
+    else:
+        content, stats = stream_completion(client, **kwargs)
+    history.record(stats["model"], stats["ttft_s"])
+    return content, stats
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from env import get_bool, get_int
+from metrics import METRICS
+from mime_render import html_to_text
+from templates import PROMPT_CATEGORY_FEEDS, build_category_prompt, build_merge_prompt
+
+# "Political News – Include global and U.S. political developments, ..."
+_CATEGORY_LINE = re.compile(r"^(?P<name>[^\n–]{2,80}?) [–-] (?P<description>.+)$", re.DOTALL)
+
+# (user message, max tokens, label) -> completion text; raises on failure
+Generate = Callable[[str, int, str], str]
+
+
+def map_reduce_enabled() -> bool:
+    return get_bool("OPENAI_MAP_REDUCE")
+
+
+def split_prompt_body(prompt_body: str) -> dict | None:
+    # Splits a PROMPT_*_BODY-style prompt into its intro, the "Name – description" category
+    # paragraphs, the "For each category, provide:" items and the "End with ..." closing.
+    # Returns None when the prompt has no such structure (e.g. a free-form custom prompt).
+    intro: List[str] = []
+    categories: List[dict] = []
+    instructions: List[str] = []
+    closing: List[str] = []
+    part = "intro"
+    for paragraph in (p.strip() for p in prompt_body.split("\n\n")):
+        if not paragraph:
+            continue
+        lower = paragraph.lower()
+        if lower.startswith("for each category"):
+            part = "instructions"
+            continue
+        if lower.startswith("end with"):
+            part = "closing"
+        if part == "closing":
+            closing.append(paragraph)
+        elif part == "instructions":
+            instructions.append(paragraph)
+        else:
+            match = _CATEGORY_LINE.match(paragraph)
+            if match:
+                categories.append({"name": match["name"].strip(), "description": match["description"].strip()})
+            else:
+                intro.append(paragraph)
+    if len(categories) < 2 or not closing:
+        return None
+    return {
+        "intro": "\n\n".join(intro),
+        "categories": categories,
+        "instructions": "\n\n".join(instructions),
+        "closing": "\n\n".join(closing),
+    }
+
+
+def slice_context(
+    news_context: str, categories: List[str], feeds: Dict[str, List[str]] | None = None
+) -> List[str]:
+    # One context per category: the blocks without a "Category:" header (e.g. the market focus
+    # line) plus the news sections of the feed categories `feeds` maps it to. A category with
+    # no mapping gets the whole context; sections are never matched by position, since feeds
+    # with no articles are left out of the context.
+    feeds = PROMPT_CATEGORY_FEEDS if feeds is None else feeds
+    shared: List[str] = []
+    sections: Dict[str, str] = {}
+    for block in (b for b in (news_context or "").split("\n\n") if b.strip()):
+        head = block.split("\n", 1)[0].rstrip()
+        if head.endswith(":") and "\n" in block:
+            sections[head[:-1].strip()] = block
+        else:
+            shared.append(block)
+    out = []
+    for name in categories:
+        if name not in feeds:
+            out.append(news_context or "")
+            continue
+        out.append("\n\n".join(shared + [sections[feed] for feed in feeds[name] if feed in sections]))
+    return out
+
+
+def generate(generate_fn: Generate, news_context: str, plan: dict, today: str | None = None) -> str:
+    # Map: one short completion per category, all in flight at once, each seeing only its own
+    # slice of the news. Reduce: one short call that writes the overall sentiment and tickers
+    # from the category summaries. Results of generate_fn are cached per call by the caller,
+    # so after a partial failure a rerun only regenerates the categories that failed.
+    map_tokens = get_int("OPENAI_MAP_MAX_TOKENS", 400)
+    merge_tokens = get_int("OPENAI_MERGE_MAX_TOKENS", 300)
+    categories = plan["categories"]
+    contexts = slice_context(news_context, [c["name"] for c in categories])
+
+    def one(n: int) -> str:
+        category = categories[n]
+        user_msg = build_category_prompt(
+            contexts[n], plan["intro"], category["name"], category["description"], plan["instructions"], today
+        )
+        with METRICS.span("map", category=category["name"]):
+            content = generate_fn(user_msg, map_tokens, category["name"])
+        if not content.strip():
+            raise RuntimeError("empty completion")
+        return content.strip()
+
+    workers = max(1, min(len(categories), get_int("OPENAI_MAP_CONCURRENCY", len(categories))))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map") as pool:
+        futures = [pool.submit(one, n) for n in range(len(categories))]
+    fragments: List[str] = []
+    failed: List[str] = []
+    for category, fut in zip(categories, futures):
+        try:
+            fragments.append(fut.result())
+        except Exception as exc:
+            failed.append(f"{category['name']} ({type(exc).__name__}: {exc})")
+    if failed:
+        METRICS.incr("map_failures", len(failed))
+        raise RuntimeError(
+            f"{len(failed)} of {len(categories)} categories failed, rerun to regenerate only these: "
+            + "; ".join(failed)
+        )
+
+    # The merge only needs the headlines and impacts, so it gets plain text, not HTML
+    sections = "\n\n".join(html_to_text(fragment) for fragment in fragments)
+    with METRICS.span("merge"):
+        closing = generate_fn(build_merge_prompt(sections, plan["closing"], today), merge_tokens, "merge")
+    if not closing.strip():
+        raise RuntimeError("Merge completion was empty")
+    return "\n".join(fragments + [closing.strip()])
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List
+
+# Mirrors what the per-region workflows inject via SUBJECT_PREFIX / FOCUS_MARKET
+BUILTIN_MARKETS: Dict[str, dict] = {
+    "usa": {
+        "focus": "United States (S&P 500, Fed, CPI/PPI, USD, UST rates, major US corporates)",
+        "subject_prefix": "Market Daily TL;DR USA",
+        "timezone": "America/Los_Angeles",
+        "send_at": "06:00",
+    },
+    "india": {
+        "focus": "India (NSE/BSE, RBI, INR, SEBI, NIFTY/BANK NIFTY, major Indian corporates)",
+        "subject_prefix": "Market Daily TL;DR (India)",
+        "timezone": "Asia/Kolkata",
+        "send_at": "06:00",
+    },
+}
+
+MARKET_KEYS = {
+    "focus",
+    "subject_prefix",
+    "system_instructions",
+    "prompt_body",
+    "recipients",
+    "recipients_file",
+    # Local send time for --daemon: an IANA timezone name and HH:MM
+    "timezone",
+    "send_at",
+}
+
+
+def load_market_config(path: str | None) -> Dict[str, dict]:
+    markets = {name: dict(cfg) for name, cfg in BUILTIN_MARKETS.items()}
+    if not path:
+        return markets
+    config_path = Path(path)
+    if not config_path.exists():
+        raise SystemExit(f"Markets config not found: {config_path}")
+    with config_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    for name, cfg in (data.get("markets") or data).items():
+        unknown = set(cfg) - MARKET_KEYS
+        if unknown:
+            raise SystemExit(f"Unknown keys for market {name!r}: {', '.join(sorted(unknown))}")
+        markets.setdefault(name.lower(), {}).update(cfg)
+    return markets
+
+
+def select_markets(names: str, config_path: str | None = None) -> List[dict]:
+    available = load_market_config(config_path)
+    selected: List[dict] = []
+    for name in [n.strip().lower() for n in names.split(",") if n.strip()]:
+        if name not in available:
+            raise SystemExit(f"Unknown market {name!r}. Known: {', '.join(sorted(available))}")
+        selected.append({"name": name, **available[name]})
+    if not selected:
+        raise SystemExit("No markets given to --markets")
+    return selected
+
+
+def market_recipients(market: dict, shard=None):
+    # A RecipientStream over the market's own recipients (this shard only), or None when the
+    # market configures none, so the shared list is used instead. A market that names its own
+    # recipients never falls back to the shared list: with none valid it raises ValueError.
+    if "recipients" not in market and "recipients_file" not in market:
+        return None
+    from recipients import RecipientStream
+
+    files = []
+    if market.get("recipients_file"):
+        path = Path(market["recipients_file"])
+        if not path.exists():
+            raise ValueError(f"recipients file not found: {path}")
+        files.append(path)
+    stream = RecipientStream(addresses=list(market.get("recipients") or []), files=files, shard=shard)
+    if not stream.scan()["unique"]:
+        raise ValueError("no valid addresses in its own recipients; not sending to the shared list")
+    print(f"[{market['name']}] Recipients: {stream.summary()}")
+    return stream
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_METRIC_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    # Nearest-rank on an already sorted list
+    rank = max(1, min(len(ordered), int(round(q * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def _summary(values: List[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "sum": round(sum(ordered), 6),
+        "p50": round(_quantile(ordered, 0.5), 6),
+        "p90": round(_quantile(ordered, 0.9), 6),
+        "p99": round(_quantile(ordered, 0.99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+def _write_atomic(path: str | os.PathLike, text: str) -> Path:
+    # Readers (e.g. node_exporter's textfile collector) never see a half-written file
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, target)
+    return target
+
+
+class Metrics:
+    # Thread-safe, in-process collector for one run: timing spans, counters, gauges and raw
+    # observations (e.g. per-recipient send latency), exported as JSON or Prometheus text.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._spans: Dict[Tuple[str, Labels], List[float]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._observations: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def rotate(self) -> "Metrics":
+        # Moves everything collected so far into a new collector and starts afresh in one step,
+        # so a long-running process can report per interval without losing or re-counting
+        # anything, and without its memory growing
+        window = Metrics()
+        with self._lock:
+            window.started_at, window._started = self.started_at, self._started
+            window._spans, window._counters = self._spans, self._counters
+            window._gauges, window._observations = self._gauges, self._observations
+            self._clear()
+        return window
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._spans.setdefault((name, _labels(labels)), []).append(elapsed)
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        if not value:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, values: float | Iterable[float], **labels) -> None:
+        batch = [values] if isinstance(values, (int, float)) else list(values)
+        if not batch:
+            return
+        with self._lock:
+            self._observations.setdefault((name, _labels(labels)), []).extend(batch)
+
+    def snapshot(self, **extra) -> dict:
+        with self._lock:
+            spans = {k: list(v) for k, v in self._spans.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            observations = {k: list(v) for k, v in self._observations.items()}
+        report = {
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec="seconds"),
+            "duration_s": round(time.monotonic() - self._started, 3),
+            **extra,
+            "spans": [
+                {"name": name, "labels": dict(labels), **_summary(values)}
+                for (name, labels), values in sorted(spans.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "gauges": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(gauges.items())
+            ],
+            "observations": [
+                {"name": name, "labels": dict(labels), **_summary(values)}
+                for (name, labels), values in sorted(observations.items())
+            ],
+        }
+        return report
+
+    def write_json(self, path: str | os.PathLike, **extra) -> Path:
+        return _write_atomic(path, json.dumps(self.snapshot(**extra), indent=2) + "\n")
+
+    def write_prometheus(self, path: str | os.PathLike, prefix: str = "market_tldr") -> Path:
+        snap = self.snapshot()
+        lines: List[str] = []
+        seen = set()
+
+        def header(metric: str, kind: str) -> None:
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+
+        def fmt(labels: dict, **more) -> str:
+            items = {**labels, **more}
+            if not items:
+                return ""
+            return "{" + ",".join(f'{_METRIC_NAME.sub("_", k)}="{_escape(str(v))}"' for k, v in sorted(items.items())) + "}"
+
+        metric = f"{prefix}_span_seconds"
+        for s in snap["spans"]:
+            header(metric, "summary")
+            labels = {"span": s["name"], **s["labels"]}
+            lines.append(f"{metric}_sum{fmt(labels)} {s['sum']}")
+            lines.append(f"{metric}_count{fmt(labels)} {s['count']}")
+        for c in snap["counters"]:
+            metric = f"{prefix}_{_METRIC_NAME.sub('_', c['name'])}_total"
+            header(metric, "counter")
+            lines.append(f"{metric}{fmt(c['labels'])} {c['value']}")
+        for g in snap["gauges"]:
+            metric = f"{prefix}_{_METRIC_NAME.sub('_', g['name'])}"
+            header(metric, "gauge")
+            lines.append(f"{metric}{fmt(g['labels'])} {g['value']}")
+        for o in snap["observations"]:
+            metric = f"{prefix}_{_METRIC_NAME.sub('_', o['name'])}"
+            header(metric, "summary")
+            for q, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+                lines.append(f"{metric}{fmt(o['labels'], quantile=q)} {o[key]}")
+            lines.append(f"{metric}_sum{fmt(o['labels'])} {o['sum']}")
+            lines.append(f"{metric}_count{fmt(o['labels'])} {o['count']}")
+        metric = f"{prefix}_run_timestamp_seconds"
+        header(metric, "gauge")
+        lines.append(f"{metric} {round(self.started_at, 3)}")
+        return _write_atomic(path, "\n".join(lines) + "\n")
+
+
+# One collector per process; the CLI resets it at the start of a run
+METRICS = Metrics()
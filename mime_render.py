@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import binascii
+import html
+import re
+from email import policy
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# Markup removed along with its contents: script/style/head/title elements (to the end of the
+# document if unclosed) and comments/declarations
+_SKIPPED = re.compile(r"<(?:(script|style|head|title)\b[^>]*>.*?(?:</\1\s*>|\Z)|!--.*?-->|[!?][^>]*>)", re.DOTALL | re.I)
+_SKIPPED_START = re.compile(r"<(?:script|style|head|title|[!?])", re.I)
+_BR = re.compile(r"<br\b[^<>]*>", re.I)
+_P_CLOSE = re.compile(r"</p\s*>", re.I)
+_TAG = re.compile(r"</?[A-Za-z][A-Za-z0-9]*[^<>]*>")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# Same header handling as Message.as_bytes(), but with the CRLF line endings SMTP expects
+_POLICY = policy.compat32.clone(linesep="\r\n")
+
+
+def html_to_text(body: str) -> str:
+    # A few C-level substitutions, no per-tag Python: skipped elements dropped, <br> -> newline,
+    # </p> -> blank line, other tags dropped (a stray "<" is kept), entities decoded, and never
+    # more than one blank line in a row.
+    if _SKIPPED_START.search(body):
+        body = _SKIPPED.sub("", body)
+    text = _TAG.sub("", _P_CLOSE.sub("\n\n", _BR.sub("\n", body)))
+    if "&" in text:
+        text = _unescape(text)
+    if "\n\n\n" in text:
+        text = _BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+
+def _unescape(text: str) -> str:
+    # "&amp;" is most of the entities in generated bodies; splitting on it leaves html.unescape's
+    # per-entity Python callback only for the rest (the result is the same, as "&amp;" is always
+    # a whole entity of its own)
+    parts = text.split("&amp;")
+    return "&".join([html.unescape(part) if "&" in part else part for part in parts])
+
+
+class MessageTemplate:
+    # The MIME tree (plain + HTML alternative) is built and serialized once; each recipient's
+    # message is the To header stamped in front of those bytes.
+
+    def __init__(self, *, subject: str, html_body: str, from_header: str, text_body: str | None = None) -> None:
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = from_header
+
+        # Plain first, then HTML
+        plain = text_body if text_body is not None else html_to_text(html_body) or subject
+        msg.attach(MIMEText(plain, "plain", _charset="utf-8"))
+        msg.attach(MIMEText(html_body, "html", _charset="utf-8"))
+        self.template = msg.as_bytes(policy=_POLICY)
+
+    def render(self, recipient: str) -> bytes:
+        if "\r" in recipient or "\n" in recipient:
+            raise ValueError(f"Invalid recipient address: {recipient!r}")
+        if recipient.isascii():
+            header = b"To: " + recipient.encode("ascii") + b"\r\n"
+        else:
+            header = _POLICY.fold_binary("To", recipient)
+        return header + self.template
+
+
+def _header(name: str, value: str) -> bytes:
+    if "\r" in value or "\n" in value:
+        raise ValueError(f"Invalid {name} header: {value!r}")
+    # ASCII values go out as-is (long ones can't be folded usefully anyway, e.g. URLs;
+    # RFC 5322 allows up to 998 characters per line)
+    if value.isascii() and len(name) + len(value) < 990:
+        return f"{name}: {value}\r\n".encode("ascii")
+    return _POLICY.fold_binary(name, value)
+
+
+def _base64(text: str) -> bytes:
+    # One C-level encode, then 76-character CRLF lines (base64.encodebytes loops per line)
+    encoded = binascii.b2a_base64(text.encode("utf-8"), newline=False)
+    return b"\r\n".join([encoded[i : i + 76] for i in range(0, len(encoded), 76)])
+
+
+class PartsTemplate:
+    # For messages whose body differs per recipient: the MIME skeleton (headers, boundaries and
+    # part headers) is serialized once, and each recipient's plain and HTML parts are
+    # base64-encoded straight into it.
+
+    _PLAIN = "@@PLAIN-PART@@"
+    _HTML = "@@HTML-PART@@"
+
+    def __init__(self, *, from_header: str, subject: str | None = None) -> None:
+        msg = MIMEMultipart("alternative")
+        if subject is not None:
+            msg["Subject"] = subject
+        msg["From"] = from_header
+        for subtype, marker in (("plain", self._PLAIN), ("html", self._HTML)):
+            part = MIMEText("", subtype, _charset="utf-8")
+            part.set_payload(marker)
+            msg.attach(part)
+        raw = msg.as_bytes(policy=_POLICY)
+        head, rest = raw.split(self._PLAIN.encode("ascii"))
+        middle, tail = rest.split(self._HTML.encode("ascii"))
+        self._segments = (head, middle, tail)
+
+    def render(self, recipient: str, plain: str, html_body: str, subject: str | None = None, headers=()) -> bytes:
+        # `subject` only when the skeleton was built without one; `headers` are extra
+        # (name, value) pairs such as List-Unsubscribe
+        head, middle, tail = self._segments
+        out = [_header("To", recipient)]
+        if subject is not None:
+            out.append(_header("Subject", subject))
+        out.extend(_header(name, value) for name, value in headers)
+        out += [head, _base64(plain), middle, _base64(html_body), tail]
+        return b"".join(out)
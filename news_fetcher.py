@@ -1,15 +1,23 @@
 from __future__ import annotations
 
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, Iterator, List, Tuple, TypeVar
+from urllib.parse import urlsplit
 
-import requests
+from article_index import ArticleIndex
+from article_store import ArticleStore
+from env import get_bool, get_float, get_int
+from feed_cache import FeedCache
+from feed_parser import feedparser_available, parse_feed, parse_with_feedparser
+from metrics import METRICS
 
-try:
-    import feedparser  # type: ignore
-except Exception:  # pragma: no cover
-    feedparser = None  # type: ignore
+if TYPE_CHECKING:
+    import requests
 
 CATEGORIES_AND_QUERIES: Dict[str, str] = {
     "Political News": "(politics OR election OR legislation OR regulatory OR geopolitical)",
@@ -47,71 +55,352 @@ RSS_FEEDS_BY_CATEGORY: Dict[str, List[str]] = {
     ],
 }
 
+T = TypeVar("T")
+
+
+def _feed_parser_mode() -> str:
+    # "stream" (default) parses incrementally and stops early; "feedparser" parses whole documents
+    return os.getenv("NEWS_FEED_PARSER", "stream").strip().lower()
+
+
+def _body_bytes(resp: requests.Response) -> int:
+    # Bytes actually read off the wire; for streamed responses that stopped early this is
+    # less than the full document.
+    raw = getattr(resp, "raw", None)
+    tell = getattr(raw, "tell", None)
+    if callable(tell):
+        try:
+            return int(tell())
+        except Exception:
+            pass
+    return len(resp.content)
+
+
+class FetchEngine:
+    # Runs fetches concurrently over one pooled keep-alive session, bounded overall by
+    # max_workers and per host by per_host, and stops waiting at a run-wide deadline.
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        per_host: int | None = None,
+        timeout: float | None = None,
+        deadline: float | None = None,
+    ) -> None:
+        self.max_workers = max_workers or get_int("NEWS_FETCH_WORKERS", 16)
+        self.per_host = per_host or get_int("NEWS_FETCH_PER_HOST", 4)
+        self.timeout = timeout or get_float("NEWS_FETCH_TIMEOUT", 20.0)
+        self.deadline = deadline or get_float("NEWS_FETCH_DEADLINE", 30.0)
+
+        # Imported here rather than at module load; requests is a noticeable part of startup
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (compatible; MarketDailyTLDR/1.0)"
+
+        # Why each job from the last run() produced no result
+        self.last_errors: Dict[Hashable, str] = {}
+        self._host_locks: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_locks_guard = threading.Lock()
+        self._expires_at: float | None = None
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._host_locks_guard:
+            sem = self._host_locks.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._host_locks[host] = sem
+            return sem
+
+    def remaining(self) -> float:
+        if self._expires_at is None:
+            return self.timeout
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @contextmanager
+    def get(self, url: str, **kwargs) -> Iterator[requests.Response]:
+        # The host slot is held until the response is closed, so a streamed body being read
+        # still counts against per_host (and its pooled connection goes back for reuse)
+        with self._host_semaphore(url):
+            timeout = min(self.timeout, self.remaining())
+            if timeout <= 0:
+                raise TimeoutError(f"Fetch deadline exceeded before requesting {url}")
+            resp = self.session.get(url, timeout=timeout, **kwargs)
+            try:
+                yield resp
+            finally:
+                resp.close()
+
+    def run(self, jobs: Dict[Hashable, Callable[[], T]]) -> Dict[Hashable, T]:
+        # Returns results for the jobs that finished without raising before the deadline;
+        # anything still in flight is abandoned.
+        self._expires_at = time.monotonic() + self.deadline
+        results: Dict[Hashable, T] = {}
+        errors: Dict[Hashable, str] = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="news-fetch")
+        try:
+            pending: Dict[Future, Hashable] = {pool.submit(fn): key for key, fn in jobs.items()}
+            while pending:
+                remaining = self.remaining()
+                if remaining <= 0:
+                    break
+                done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key = pending.pop(fut)
+                    exc = fut.exception()
+                    if exc is None:
+                        results[key] = fut.result()
+                    else:
+                        errors[key] = f"{type(exc).__name__}: {exc}"
+            for key in pending.values():
+                errors[key] = "deadline exceeded"
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._expires_at = None
+            self.last_errors = errors
+        return results
+
+    def close(self) -> None:
+        self.session.close()
+
 
 class NewsFetcher:
-    def __init__(self, api_key: str | None = None) -> None:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        engine: FetchEngine | None = None,
+        cache: FeedCache | None = None,
+        store: ArticleStore | None = None,
+    ) -> None:
         self.api_key = api_key or os.getenv("NEWSAPI_KEY")
+        self.engine = engine or FetchEngine()
+        if cache is None and not get_bool("FEED_CACHE_DISABLE"):
+            cache = FeedCache()
+        self.cache = cache
+        if store is None and not get_bool("ARTICLE_STORE_DISABLE"):
+            store = ArticleStore()
+        self.store = store
 
     def is_configured(self) -> bool:
         return bool(self.api_key)
 
     def fetch_context(self, per_category: int = 4, lookback_days: int = 2) -> str:
         if self.is_configured():
-            return self._fetch_via_newsapi(per_category=per_category, lookback_days=lookback_days)
-        return self._fetch_via_rss(per_category=per_category)
+            context = self._fetch_via_newsapi(per_category=per_category, lookback_days=lookback_days)
+        else:
+            context = self._fetch_via_rss(per_category=per_category, lookback_days=lookback_days)
+        if self.cache is not None:
+            self.cache.evict()
+            for name, value in self.cache.stats.items():
+                METRICS.incr(f"feed_cache_{name}", value)
+        return context
+
+    def _cached_fetch(
+        self,
+        key: str,
+        url: str,
+        parse: Callable[[requests.Response], List[dict]],
+        **kwargs,
+    ) -> List[dict]:
+        cache = self.cache
+        host = urlsplit(url).netloc
+        # Closed on every path (304s and error statuses included), so streamed responses always
+        # hand their pooled connection back
+        if cache is None:
+            with self.engine.get(url, **kwargs) as resp:
+                resp.raise_for_status()
+                entries = parse(resp)
+                METRICS.incr("feed_bytes", _body_bytes(resp), host=host)
+            return entries
+
+        entry = cache.get(key)
+        if entry is not None and cache.is_fresh(entry):
+            cache.record("hits", bytes_saved=entry["body_bytes"])
+            return entry["entries"]
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(cache.conditional_headers(entry))
+        with self.engine.get(url, headers=headers, **kwargs) as resp:
+            if resp.status_code == 304 and entry is not None:
+                cache.touch(key, entry)
+                cache.record("revalidated", bytes_saved=entry["body_bytes"])
+                return entry["entries"]
+            resp.raise_for_status()
+            entries = parse(resp)
+            body_bytes = _body_bytes(resp)
+        METRICS.incr("feed_bytes", body_bytes, host=host)
+        cache.put(
+            key,
+            entries,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            body_bytes=body_bytes,
+        )
+        cache.record("misses", bytes_fetched=body_bytes)
+        return entries
+
+    def _gather(
+        self, jobs: Dict[Tuple[str, str], Tuple[str, Callable[[], List[dict]]]]
+    ) -> Dict[Tuple[str, str], List[dict]]:
+        # Jobs are keyed by (category, source). Run them concurrently; anything that failed or
+        # missed the deadline is served from a stale cache entry if one is still usable (its
+        # revalidation keeps running).
+        def timed(key: Tuple[str, str], fn: Callable[[], List[dict]]) -> Callable[[], List[dict]]:
+            def run() -> List[dict]:
+                with METRICS.span("feed_fetch", category=key[0], source=key[1]):
+                    return fn()
+
+            return run
+
+        with METRICS.span("feed_gather"):
+            results = self.engine.run({key: timed(key, fn) for key, (_, fn) in jobs.items()})
+        errors = self.engine.last_errors
+        for (category, source), error in errors.items():
+            reason = "deadline" if error == "deadline exceeded" else error.split(":", 1)[0]
+            METRICS.incr("feed_errors", category=category, source=source, reason=reason)
+        if errors:
+            shown = "; ".join(f"{source}: {error[:80]}" for (_, source), error in sorted(errors.items())[:5])
+            more = f" (+{len(errors) - 5} more)" if len(errors) > 5 else ""
+            print(f"News fetch: {len(errors)} of {len(jobs)} sources failed: {shown}{more}")
+        if self.cache is None:
+            return results
+        for key, (cache_key, _) in jobs.items():
+            if key in results:
+                continue
+            entry = self.cache.get(cache_key)
+            if entry is not None and self.cache.is_usable_stale(entry):
+                self.cache.record("stale_served", bytes_saved=entry["body_bytes"])
+                results[key] = entry["entries"]
+        return results
 
     def _fetch_via_newsapi(self, per_category: int, lookback_days: int) -> str:
         base_url = "https://newsapi.org/v2/everything"
-        from datetime import datetime, timedelta
-        from_param = (datetime.utcnow() - timedelta(days=lookback_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
-        sections: List[str] = []
-        for category, query in CATEGORIES_AND_QUERIES.items():
+        started = time.time()
+        floor = started - lookback_days * 86400
+
+        def window_start(query: str) -> float:
+            # With a store, only ask for what arrived since the last successful pull (plus an
+            # hour of overlap for late-indexed articles); the store already has the rest
+            mark = self.store.watermark(f"newsapi:{query}") if self.store is not None else None
+            return max(floor, mark - 3600) if mark else floor
+
+        def fetch(key: str, query: str) -> List[dict]:
             params = {
                 "q": query,
                 "language": "en",
-                "from": from_param,
+                "from": datetime.utcfromtimestamp(window_start(query)).strftime("%Y-%m-%dT%H:%M:%SZ"),
                 "sortBy": "publishedAt",
-                "pageSize": per_category,
+                # Extra candidates so cross-category duplicates can be dropped
+                "pageSize": per_category * 2,
             }
-            resp = requests.get(base_url, params=params, headers={"X-Api-Key": self.api_key}, timeout=20)
-            if resp.status_code != 200:
-                continue
-            data = resp.json()
-            articles = data.get("articles", [])
+            return self._cached_fetch(
+                key,
+                base_url,
+                lambda resp: resp.json().get("articles", []),
+                params=params,
+                headers={"X-Api-Key": self.api_key},
+            )
+
+        jobs = {}
+        for category, query in CATEGORIES_AND_QUERIES.items():
+            # `from` moves every second, so key on what actually selects the articles
+            key = f"newsapi:{query}:{per_category}:{lookback_days}"
+            jobs[(category, "newsapi")] = (key, lambda k=key, q=query: fetch(k, q))
+        results = self._gather(jobs)
+        failed = self.engine.last_errors
+        if self.store is not None:
+            self.store.set_watermarks(
+                {
+                    f"newsapi:{query}": started
+                    for category, query in CATEGORIES_AND_QUERIES.items()
+                    if (category, "newsapi") not in failed
+                }
+            )
+
+        fetched = {
+            category: [
+                {
+                    "title": a.get("title") or "Untitled",
+                    "link": a.get("url") or "",
+                    "published": a.get("publishedAt") or "",
+                    "source": (a.get("source") or {}).get("name") or "Unknown",
+                }
+                for a in results.get((category, "newsapi")) or []
+            ]
+            for category in CATEGORIES_AND_QUERIES
+        }
+        return self._build_context(fetched, list(CATEGORIES_AND_QUERIES), per_category, lookback_days)
+
+    def _fetch_feed(self, url: str, limit: int) -> List[dict]:
+        if _feed_parser_mode() == "feedparser":
+            return self._cached_fetch(url, url, lambda resp: parse_with_feedparser(resp.content))
+
+        def parse(resp: requests.Response) -> List[dict]:
+            # Stop reading the socket once `limit` entries have been parsed
+            with resp:
+                return parse_feed(resp.iter_content(chunk_size=16384), limit=limit)
+
+        return self._cached_fetch(url, url, parse, stream=True)
+
+    def _fetch_via_rss(self, per_category: int, lookback_days: int = 2) -> str:
+        if _feed_parser_mode() == "feedparser" and not feedparser_available():
+            return ""
+        jobs = {}
+        for category, feeds in RSS_FEEDS_BY_CATEGORY.items():
+            for url in feeds:
+                jobs[(category, url)] = (url, lambda u=url: self._fetch_feed(u, per_category * 2))
+        results = self._gather(jobs)
+
+        fetched = {
+            category: [a for url in feeds for a in (results.get((category, url)) or [])[: per_category * 2]]
+            for category, feeds in RSS_FEEDS_BY_CATEGORY.items()
+        }
+        return self._build_context(fetched, list(RSS_FEEDS_BY_CATEGORY), per_category, lookback_days)
+
+    def _build_context(
+        self,
+        fetched: Dict[str, List[dict]],
+        categories: List[str],
+        per_category: int,
+        lookback_days: int,
+    ) -> str:
+        index = ArticleIndex(CATEGORIES_AND_QUERIES)
+        if self.store is None:
+            for category in categories:
+                index.add(category, fetched.get(category) or [])
+            return self._format_sections(index.select(per_category, categories))
+
+        # Only new articles are written. Alongside this run's articles, the stored corpus is
+        # queried so stories from earlier runs inside the window still count (the index drops
+        # the copies of this run's articles it returns)
+        new = sum(self.store.ingest(category, articles) for category, articles in fetched.items())
+        since = time.time() - lookback_days * 86400
+        for category in categories:
+            index.add(category, fetched.get(category) or [])
+            index.add(
+                category,
+                self.store.candidates(category, CATEGORIES_AND_QUERIES.get(category, ""), since, per_category * 4),
+            )
+        pruned = self.store.prune()
+        METRICS.incr("articles_new", new)
+        METRICS.incr("articles_pruned", pruned)
+        METRICS.gauge("article_store_size", len(self.store))
+        return self._format_sections(index.select(per_category, categories))
+
+    @staticmethod
+    def _format_sections(selected: Dict[str, List[dict]]) -> str:
+        sections: List[str] = []
+        for category, articles in selected.items():
             if not articles:
                 continue
             lines: List[str] = [f"{category}:"]
-            for a in articles[:per_category]:
-                title = a.get("title") or "Untitled"
-                source = (a.get("source") or {}).get("name") or "Unknown"
-                url = a.get("url") or ""
-                published_at = a.get("publishedAt") or ""
-                lines.append(f"- {title} ({source}, {published_at}) — {url}")
+            for a in articles:
+                meta = f"{a['source']}, {a['published']}" if a.get("source") else a["published"]
+                lines.append(f"- {a['title']} ({meta}) — {a['link']}")
             sections.append("\n".join(lines))
         return "\n\n".join(sections)
-
-    def _fetch_via_rss(self, per_category: int) -> str:
-        if feedparser is None:
-            return ""
-        sections: List[str] = []
-        for category, feeds in RSS_FEEDS_BY_CATEGORY.items():
-            lines: List[str] = [f"{category}:"]
-            added = 0
-            for url in feeds:
-                try:
-                    parsed = feedparser.parse(url)
-                except Exception:
-                    continue
-                for entry in parsed.entries[: per_category * 2]:
-                    title = getattr(entry, "title", None) or "Untitled"
-                    link = getattr(entry, "link", None) or ""
-                    published = getattr(entry, "published", getattr(entry, "updated", ""))
-                    lines.append(f"- {title} ({published}) — {link}")
-                    added += 1
-                    if added >= per_category:
-                        break
-                if added >= per_category:
-                    break
-            if added > 0:
-                sections.append("\n".join(lines))
-        return "\n\n".join(sections) 
\ No newline at end of file
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from smtp_delivery import DeliveryReport
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    run_date TEXT NOT NULL,
+    market TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    html_body TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_date, market)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    idempotency_key TEXT PRIMARY KEY,
+    run_date TEXT NOT NULL,
+    market TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS deliveries_queue ON deliveries (run_date, market, status);
+"""
+
+
+def idempotency_key(run_date: str, market: str, recipient: str) -> str:
+    return hashlib.sha256(f"{run_date}\x1f{market}\x1f{recipient.lower()}".encode("utf-8")).hexdigest()
+
+
+class Outbox:
+    # Durable hand-off between generation and delivery: the rendered message is stored once
+    # per (run date, market) and every recipient gets a row keyed by an idempotency key, so a
+    # rerun only sends what is still undelivered. With store_addresses=False no address is
+    # written to disk, only its idempotency key; drain_list() then matches the recipient list
+    # against the queue.
+
+    def __init__(
+        self, path: str | os.PathLike | None = None, max_attempts: int = 3, store_addresses: bool = True
+    ) -> None:
+        self.path = Path(path or os.getenv("OUTBOX_PATH", ".cache/outbox.sqlite3"))
+        self.max_attempts = max_attempts
+        self.store_addresses = store_addresses
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_message(self, run_date: str, market: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT subject, html_body, created_at FROM messages WHERE run_date = ? AND market = ?",
+                (run_date, market),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"subject": row[0], "html_body": row[1], "created_at": row[2]}
+
+    def markets(self, run_date: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT market FROM messages WHERE run_date = ? ORDER BY market", (run_date,)).fetchall()
+        return [r[0] for r in rows]
+
+    def save_message(self, run_date: str, market: str, subject: str, html_body: str) -> dict:
+        # First writer wins; a rerun keeps the body that may already have reached some inboxes
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)",
+                (run_date, market, subject, html_body, time.time()),
+            )
+        return self.get_message(run_date, market)  # type: ignore[return-value]
+
+    def enqueue(self, run_date: str, market: str, recipients: Iterable[str], queue: str | None = None) -> int:
+        # Rows are streamed into SQLite, so the recipient list never has to be in memory.
+        # `queue` (default: the market) names the delivery queue, e.g. one per --shard; the
+        # idempotency key stays per market, so a recipient is only ever queued once a day.
+        rows = (
+            (idempotency_key(run_date, market, r), run_date, queue or market, r if self.store_addresses else "")
+            for r in recipients
+        )
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (idempotency_key, run_date, market, recipient) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            return conn.total_changes - before
+
+    def _next_batch(self, run_date: str, market: str, after: int, limit: int) -> List[tuple]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT rowid, idempotency_key, recipient FROM deliveries"
+                " WHERE run_date = ? AND market = ? AND status != 'delivered' AND attempts < ? AND rowid > ?"
+                " AND recipient != ''"
+                " ORDER BY rowid LIMIT ?",
+                (run_date, market, self.max_attempts, after, limit),
+            ).fetchall()
+
+    def _queued(self, run_date: str, queue: str, keys: List[str]) -> List[tuple]:
+        # (rowid, key) of the given keys that are still to be attempted in `queue`
+        rows: List[tuple] = []
+        with self._connect() as conn:
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                rows += conn.execute(
+                    "SELECT rowid, idempotency_key FROM deliveries WHERE run_date = ? AND market = ?"
+                    " AND status != 'delivered' AND attempts < ?"
+                    f" AND idempotency_key IN ({', '.join('?' * len(part))})",
+                    (run_date, queue, self.max_attempts, *part),
+                ).fetchall()
+        return rows
+
+    def _record(self, batch: List[tuple], report: DeliveryReport) -> None:
+        now = time.time()
+        delivered = [(now, key) for _, key, recipient in batch if recipient in report.latencies]
+        failed = [
+            (report.failed.get(recipient, "not attempted"), key)
+            for _, key, recipient in batch
+            if recipient not in report.latencies
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE deliveries SET status = 'delivered', attempts = attempts + 1, delivered_at = ?,"
+                " last_error = NULL WHERE idempotency_key = ?",
+                delivered,
+            )
+            conn.executemany(
+                "UPDATE deliveries SET status = 'failed', attempts = attempts + 1, last_error = ?"
+                " WHERE idempotency_key = ?",
+                failed,
+            )
+
+    def drain(
+        self,
+        run_date: str,
+        market: str,
+        send_batch: Callable[[List[str]], DeliveryReport],
+        batch_size: int = 500,
+    ) -> dict:
+        # Each undelivered row is attempted at most once per drain
+        start = time.monotonic()
+        after = 0
+        attempted = 0
+        delivered = 0
+        while True:
+            batch = self._next_batch(run_date, market, after, batch_size)
+            if not batch:
+                break
+            after = batch[-1][0]
+            report = send_batch([recipient for _, _, recipient in batch])
+            self._record(batch, report)
+            attempted += len(batch)
+            delivered += sum(1 for _, _, r in batch if r in report.latencies)
+        return self._drain_stats(run_date, market, start, attempted, delivered)
+
+    def drain_list(
+        self,
+        run_date: str,
+        market: str,
+        queue: str,
+        recipients: Iterable[str],
+        send_batch: Callable[[List[str]], DeliveryReport],
+        batch_size: int = 500,
+    ) -> dict:
+        # drain() for an outbox that keeps no addresses: reads the (deduplicated) recipient list
+        # again and sends to each address whose row in `queue` is still undelivered
+        start = time.monotonic()
+        attempted = 0
+        delivered = 0
+        it = iter(recipients)
+        while True:
+            chunk = list(itertools.islice(it, batch_size))
+            if not chunk:
+                break
+            by_key = {idempotency_key(run_date, market, r): r for r in chunk}
+            batch = [(rowid, key, by_key[key]) for rowid, key in self._queued(run_date, queue, list(by_key))]
+            if not batch:
+                continue
+            report = send_batch([recipient for _, _, recipient in batch])
+            self._record(batch, report)
+            attempted += len(batch)
+            delivered += sum(1 for _, _, r in batch if r in report.latencies)
+        return self._drain_stats(run_date, queue, start, attempted, delivered)
+
+    def _drain_stats(self, run_date: str, market: str, start: float, attempted: int, delivered: int) -> dict:
+        elapsed = time.monotonic() - start
+        stats = self.stats(run_date, market)
+        stats.update(
+            {
+                "attempted": attempted,
+                "delivered_now": delivered,
+                "seconds": round(elapsed, 3),
+                "drain_rate": round(delivered / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+        )
+        return stats
+
+    def stats(self, run_date: str, market: str) -> Dict[str, int]:
+        # queue_depth counts only rows a later drain will still attempt; undelivered rows that
+        # used up max_attempts are "exhausted" and never picked again
+        counts = {"pending": 0, "delivered": 0, "failed": 0, "exhausted": 0}
+        with self._connect() as conn:
+            for status, exhausted, n in conn.execute(
+                "SELECT status, status != 'delivered' AND attempts >= ?, COUNT(*) FROM deliveries"
+                " WHERE run_date = ? AND market = ? GROUP BY 1, 2",
+                (self.max_attempts, run_date, market),
+            ):
+                counts[status] += n
+                if exhausted:
+                    counts["exhausted"] += n
+        counts["queue_depth"] = counts["pending"] + counts["failed"] - counts["exhausted"]
+        return counts
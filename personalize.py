@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import hmac
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from env import get_int
+from mime_render import PartsTemplate, html_to_text
+from templates import EMAIL_HTML_SHELL, EMAIL_TEXT_SHELL
+
+PROFILE_SUFFIXES = {".csv", ".jsonl", ".ndjson"}
+
+# Fields filled in per recipient; everything else in the shells is bound once per send
+RECIPIENT_SLOTS = (
+    "greeting_html",
+    "greeting_text",
+    "watchlist_html",
+    "watchlist_text",
+    "unsubscribe_html",
+    "unsubscribe_text",
+)
+SUBJECT_SLOTS = ("first_name", "watchlist")
+
+_TICKER_SPLIT = re.compile(r"[\s,;|]+")
+_BODY = re.compile(r"<body\b[^>]*>(.*)</body\s*>", re.IGNORECASE | re.DOTALL)
+
+
+class CompiledTemplate:
+    # A str.format-style template parsed once into static segments and named slots. Binding
+    # values folds them into the neighbouring static text, so after the per-send fields
+    # (subject, content) are bound, rendering a recipient is one list copy plus one join.
+
+    def __init__(self, parts: Sequence[Tuple[bool, str]]) -> None:
+        merged: List[Tuple[bool, str]] = []
+        for is_slot, value in parts:
+            if not is_slot and merged and not merged[-1][0]:
+                merged[-1] = (False, merged[-1][1] + value)
+            elif is_slot or value:
+                merged.append((is_slot, value))
+        self.parts = tuple(merged)
+        self._static = [value if not is_slot else "" for is_slot, value in merged]
+        self._slots = tuple((n, value) for n, (is_slot, value) in enumerate(merged) if is_slot)
+
+    @classmethod
+    def compile(cls, template: str) -> "CompiledTemplate":
+        parts: List[Tuple[bool, str]] = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            parts.append((False, literal))
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Unsupported template field: {{{field}}}")
+            parts.append((True, field))
+        return cls(parts)
+
+    @property
+    def slots(self) -> List[str]:
+        return [name for _, name in self._slots]
+
+    def bind(self, **values: str) -> "CompiledTemplate":
+        return CompiledTemplate(
+            [(False, values[value]) if is_slot and value in values else (is_slot, value) for is_slot, value in self.parts]
+        )
+
+    def render(self, values: Dict[str, str]) -> str:
+        out = self._static.copy()
+        for n, name in self._slots:
+            out[n] = values[name]
+        return "".join(out)
+
+    def render_batch(self, rows: Iterable[Dict[str, str]]) -> List[str]:
+        static, slots, join = self._static, self._slots, "".join
+        rendered = []
+        for values in rows:
+            out = static.copy()
+            for n, name in slots:
+                out[n] = values[name]
+            rendered.append(join(out))
+        return rendered
+
+    def render_tokens(self, token: str = "-{}-") -> str:
+        # Slots written as literal tokens, for providers that substitute per recipient
+        # themselves (SendGrid personalizations[].substitutions)
+        return self.render({name: token.format(name) for name in self.slots})
+
+
+def is_profile_file(path: str | os.PathLike) -> bool:
+    return Path(path).suffix.lower() in PROFILE_SUFFIXES
+
+
+def _watchlist(value) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        items = [str(v) for v in value]
+    else:
+        items = _TICKER_SPLIT.split(str(value or ""))
+    return [t.strip().upper() for t in items if t.strip()]
+
+
+def iter_recipient_records(path: str | os.PathLike) -> Iterator[dict]:
+    # Streams {email, name, watchlist, market, unsubscribe_url} from a CSV (header row, any
+    # column order and case) or JSONL file, one row at a time. Rows without an address are skipped.
+    path = Path(path)
+    with path.open("r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows: Iterable[dict] = (
+                {(k or "").strip().lower(): v for k, v in row.items()}
+                for row in csv.DictReader(line for line in f if not line.startswith("#"))
+            )
+        else:
+            rows = (json.loads(line) for line in f if line.strip() and not line.startswith("#"))
+        for row in rows:
+            email = str(row.get("email") or "").strip()
+            if not email:
+                continue
+            yield {
+                "email": email,
+                "name": " ".join(str(row.get("name") or "").split()),
+                "watchlist": _watchlist(row.get("watchlist") or row.get("tickers")),
+                "market": str(row.get("market") or "").strip().lower(),
+                "unsubscribe_url": str(row.get("unsubscribe_url") or "").strip(),
+            }
+
+
+def unsubscribe_url(email: str) -> str:
+    # UNSUBSCRIBE_URL is a template such as https://example.com/unsubscribe?e={email}&t={token};
+    # the token is an HMAC of the address under UNSUBSCRIBE_SECRET
+    template = os.getenv("UNSUBSCRIBE_URL", "").strip()
+    if not template:
+        return ""
+    secret = os.getenv("UNSUBSCRIBE_SECRET", "").encode("utf-8")
+    token = hmac.new(secret, email.lower().encode("utf-8"), hashlib.sha256).hexdigest()[:32] if secret else ""
+    return template.replace("{email}", quote(email, safe="")).replace("{token}", token)
+
+
+def recipient_values(record: dict) -> Dict[str, str]:
+    # Values for RECIPIENT_SLOTS (HTML ones already escaped) plus the unsubscribe URL
+    first = record.get("name", "").split(" ", 1)[0]
+    greeting = f"Hi {first}," if first else "Hi,"
+    watchlist = ", ".join(record.get("watchlist") or ())
+    url = record.get("unsubscribe_url") or unsubscribe_url(record["email"])
+    return {
+        "greeting_html": html.escape(greeting),
+        "greeting_text": greeting,
+        "watchlist_html": (
+            f'<p style="margin:0 0 16px; font-size:14px;">Your watchlist: <strong>{html.escape(watchlist)}</strong></p>'
+            if watchlist
+            else ""
+        ),
+        "watchlist_text": f"Your watchlist: {watchlist}\n\n" if watchlist else "",
+        "unsubscribe_html": f'<a href="{html.escape(url)}" style="color:#888;">Unsubscribe</a>' if url else "",
+        "unsubscribe_text": f"Unsubscribe: {url}" if url else "",
+        "unsubscribe_url": url,
+        "first_name": first,
+        "watchlist": watchlist,
+    }
+
+
+class ProfileStore:
+    # Recipient records keyed by lowercased address. Kept in memory up to `max_entries`
+    # (PROFILE_MEMORY, default 100k), after which they move to a temporary on-disk SQLite table
+    # like recipients.Deduper, so memory stays bounded however long the list is. The first
+    # record added for an address wins. Safe to read from several send threads at once.
+
+    def __init__(self, max_entries: int | None = None) -> None:
+        self.max_entries = max_entries or get_int("PROFILE_MEMORY", 100_000)
+        self._memory: Dict[str, dict] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, address: str, record: dict) -> None:
+        key = address.lower()
+        if self._db is None:
+            if key not in self._memory:
+                self._memory[key] = record
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._spill()
+            return
+        with self._lock:
+            added = self._db.execute(
+                "INSERT OR IGNORE INTO profiles VALUES (?, ?)", (key, json.dumps(record, ensure_ascii=False))
+            ).rowcount
+        self._count += added
+
+    def _spill(self) -> None:
+        # "" opens a private temporary database file that SQLite deletes on close
+        self._db = sqlite3.connect("", check_same_thread=False)
+        self._db.execute("CREATE TABLE profiles (address TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        self._db.executemany(
+            "INSERT INTO profiles VALUES (?, ?)",
+            ((key, json.dumps(record, ensure_ascii=False)) for key, record in self._memory.items()),
+        )
+        self._memory = {}
+
+    def get(self, address: str, default: dict | None = None) -> dict | None:
+        return self.get_many([address]).get(address.lower(), default)
+
+    def get_many(self, addresses: Iterable[str]) -> Dict[str, dict]:
+        # The records found, keyed by lowercased address; one indexed query per 500 once spilled
+        keys = list(dict.fromkeys(a.lower() for a in addresses))
+        if self._db is None:
+            memory = self._memory
+            return {key: memory[key] for key in keys if key in memory}
+        found: Dict[str, dict] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                for key, record in self._db.execute(
+                    f"SELECT address, record FROM profiles WHERE address IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    found[key] = json.loads(record)
+        return found
+
+    @property
+    def spilled(self) -> bool:
+        return self._db is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        self._memory = {}
+
+
+def _content_fragment(html_body: str) -> str:
+    # The shell supplies <html>/<body>; keep only the inside of a full document
+    match = _BODY.search(html_body)
+    return match.group(1) if match else html_body
+
+
+class Personalizer:
+    # Renders one send's email for many recipients. The HTML and text shells are compiled and
+    # the per-send fields (subject, generated time, content) bound once; each recipient then
+    # only fills in RECIPIENT_SLOTS and gets base64-encoded into a pre-serialized MIME skeleton.
+
+    def __init__(
+        self,
+        *,
+        subject: str,
+        html_body: str,
+        from_header: str,
+        profiles: ProfileStore | Mapping[str, dict],
+        generated_at: str | None = None,
+    ) -> None:
+        self.subject = subject
+        self.profiles = profiles
+        generated_at = generated_at or datetime.now().strftime("%Y-%m-%d %H:%M")
+        content = _content_fragment(html_body)
+        self.html = CompiledTemplate.compile(EMAIL_HTML_SHELL).bind(
+            subject=html.escape(subject), generated_at=generated_at, content_html=content
+        )
+        self.text = CompiledTemplate.compile(EMAIL_TEXT_SHELL).bind(
+            subject=subject, generated_at=generated_at, content_text=html_to_text(content)
+        )
+        # EMAIL_SUBJECT_TEMPLATE, e.g. "{subject} — {watchlist}"; the default needs no
+        # per-recipient work and keeps the Subject in the pre-serialized skeleton
+        subject_template = CompiledTemplate.compile(os.getenv("EMAIL_SUBJECT_TEMPLATE") or "{subject}").bind(subject=subject)
+        unknown = set(subject_template.slots) - set(SUBJECT_SLOTS)
+        if unknown:
+            raise ValueError(f"EMAIL_SUBJECT_TEMPLATE: unknown fields {', '.join(sorted(unknown))}")
+        self.subject_template = subject_template if subject_template.slots else None
+        self.mime = PartsTemplate(from_header=from_header, subject=None if self.subject_template else subject)
+
+    def _record(self, recipient: str) -> dict:
+        return self.profiles.get(recipient.lower()) or {"email": recipient}
+
+    def _records(self, recipients: Sequence[str]) -> List[dict]:
+        # One lookup for the whole batch when the profiles live in a ProfileStore
+        found = self.profiles.get_many(recipients) if isinstance(self.profiles, ProfileStore) else self.profiles
+        return [found.get(r.lower()) or {"email": r} for r in recipients]
+
+    def render(self, recipient: str) -> bytes:
+        return self.render_batch([recipient])[0]
+
+    def render_batch(self, recipients: Sequence[str]) -> List[bytes]:
+        values = [recipient_values(record) for record in self._records(recipients)]
+        texts = self.text.render_batch(values)
+        htmls = self.html.render_batch(values)
+        subjects = self.subject_template.render_batch(values) if self.subject_template else [None] * len(values)
+        render = self.mime.render
+        return [
+            render(
+                recipient,
+                text,
+                body,
+                subject=subject,
+                headers=[("List-Unsubscribe", f"<{v['unsubscribe_url']}>")] if v["unsubscribe_url"] else (),
+            )
+            for recipient, v, text, body, subject in zip(recipients, values, texts, htmls, subjects)
+        ]
+
+    def sendgrid_content(self) -> Tuple[str, str, Callable[[str], dict]]:
+        # (text template, HTML template, recipient -> personalization fields), the slots left
+        # as -name- tokens for SendGrid to fill in from each personalization's substitutions
+        def personalization(recipient: str) -> dict:
+            values = recipient_values(self._record(recipient))
+            fields: dict = {"substitutions": {f"-{name}-": values[name] for name in RECIPIENT_SLOTS}}
+            if self.subject_template is not None:
+                fields["subject"] = self.subject_template.render(values)
+            if values["unsubscribe_url"]:
+                fields["headers"] = {"List-Unsubscribe": f"<{values['unsubscribe_url']}>"}
+            return fields
+
+        return self.text.render_tokens(), self.html.render_tokens(), personalization
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+from email.utils import parseaddr
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from env import get_int
+
+_LOCAL_PART = re.compile(r"^[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*$")
+_DOMAIN_LABEL = re.compile(r"^(?!-)[A-Za-z0-9-]{1,63}(?<!-)$")
+
+Shard = Tuple[int, int]
+
+
+def parse_shard(value: str) -> Shard:
+    # "i/N" with 0 <= i < N, e.g. a workflow matrix index over N jobs
+    index, sep, count = value.partition("/")
+    try:
+        i, n = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"expected i/N, got {value!r}") from None
+    if not sep or n < 1 or not 0 <= i < n:
+        raise ValueError(f"expected i/N with 0 <= i < N, got {value!r}")
+    return i, n
+
+
+def normalize_address(raw: str) -> Optional[str]:
+    # "Foo Bar <Foo@Example.COM>" / "mailto:foo@example.com" -> "Foo@example.com"; None if the
+    # address is not a deliverable ASCII mailbox (the SMTP path does not speak SMTPUTF8)
+    raw = raw.strip()
+    if raw[:7].lower() == "mailto:":
+        raw = raw[7:]
+    # email.utils.parseaddr is slow pure Python; only display-name forms need it
+    addr = parseaddr(raw)[1].strip() if "<" in raw else raw
+    local, at, domain = addr.rpartition("@")
+    if not at or not local or len(addr) > 254 or len(local) > 64 or not _LOCAL_PART.match(local):
+        return None
+    domain = domain.rstrip(".").lower()
+    if not domain.isascii():
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    labels = domain.split(".")
+    if len(labels) < 2 or not all(_DOMAIN_LABEL.match(label) for label in labels):
+        return None
+    return f"{local}@{domain}"
+
+
+def address_digest(address: str) -> int:
+    # Stable across processes and machines (unlike hash()), so every shard agrees
+    return int.from_bytes(hashlib.blake2b(address.lower().encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shard_of(address: str, count: int) -> int:
+    return address_digest(address) % count
+
+
+class Deduper:
+    # Exact case-insensitive dedupe keyed by 64-bit address digests. Digests are kept in memory
+    # up to `max_entries` (RECIPIENT_DEDUPE_MEMORY, default 500k), after which they move to a
+    # temporary on-disk SQLite table, so memory stays bounded however long the list is.
+
+    def __init__(self, max_entries: int | None = None) -> None:
+        self.max_entries = max_entries or get_int("RECIPIENT_DEDUPE_MEMORY", 500_000)
+        self._memory: set = set()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def add_many(self, digests: Sequence[int]) -> List[bool]:
+        # For each digest in order, True if it was not seen before (earlier in the same call
+        # included). Once spilled, a whole block costs a few indexed lookups and one insert.
+        if self._db is None:
+            memory = self._memory
+            new = []
+            for digest in digests:
+                if digest in memory:
+                    new.append(False)
+                else:
+                    memory.add(digest)
+                    new.append(True)
+            if len(memory) > self.max_entries:
+                self._spill()
+            return new
+
+        keys = [d - (1 << 63) for d in digests]
+        unique = list(dict.fromkeys(keys))
+        known = set()
+        for i in range(0, len(unique), 500):
+            chunk = unique[i : i + 500]
+            known.update(
+                row[0]
+                for row in self._db.execute(
+                    f"SELECT digest FROM seen WHERE digest IN ({','.join('?' * len(chunk))})", chunk
+                )
+            )
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((k,) for k in unique if k not in known))
+        new = []
+        for key in keys:
+            new.append(key not in known)
+            known.add(key)
+        return new
+
+    def _spill(self) -> None:
+        # "" opens a private temporary database file that SQLite deletes on close
+        self._db = sqlite3.connect("")
+        self._db.execute("CREATE TABLE seen (digest INTEGER PRIMARY KEY)")
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((d - (1 << 63),) for d in self._memory))
+        self._memory = set()
+
+    @property
+    def spilled(self) -> bool:
+        return self._db is not None
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _read_file(path: Path) -> Iterator[str]:
+    from personalize import is_profile_file, iter_recipient_records
+
+    if is_profile_file(path):
+        for record in iter_recipient_records(path):
+            yield record["email"]
+        return
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+class RecipientStream:
+    # Lazily reads addresses from in-line lists and recipient files (one address per line, or
+    # CSV/JSONL profiles), normalizing, validating and deduping case-insensitively as it goes,
+    # and keeps only this process's shard. Iterating again re-reads the sources, so nothing
+    # but the dedupe state is held in memory.
+
+    def __init__(
+        self,
+        *,
+        addresses: Sequence[str] = (),
+        files: Sequence[str | os.PathLike] = (),
+        shard: Shard | None = None,
+        keep: Callable[[str], bool] | None = None,
+    ) -> None:
+        self.addresses = list(addresses)
+        self.files = [Path(p) for p in files]
+        self.shard = shard
+        self.keep = keep
+        self.stats: Dict[str, int] = {}
+        self.invalid: List[str] = []
+
+    def filtered(self, keep: Callable[[str], bool]) -> "RecipientStream":
+        return RecipientStream(addresses=self.addresses, files=self.files, shard=self.shard, keep=keep)
+
+    def _raw(self) -> Iterator[str]:
+        yield from self.addresses
+        for path in self.files:
+            yield from _read_file(path)
+
+    def __iter__(self) -> Iterator[str]:
+        stats = {"read": 0, "invalid": 0, "duplicates": 0, "unique": 0, "other_shards": 0, "selected": 0}
+        self.stats = stats
+        self.invalid = []
+        seen = Deduper()
+        try:
+            for block in iter_chunks(self._raw(), 2000):
+                stats["read"] += len(block)
+                addresses = []
+                for raw in block:
+                    address = normalize_address(raw)
+                    if address is not None:
+                        addresses.append(address)
+                    elif len(self.invalid) < 5:
+                        self.invalid.append(raw.strip())
+                stats["invalid"] += len(block) - len(addresses)
+                digests = [address_digest(a) for a in addresses]
+                for address, digest, new in zip(addresses, digests, seen.add_many(digests)):
+                    if not new:
+                        stats["duplicates"] += 1
+                        continue
+                    stats["unique"] += 1
+                    if self.shard is not None and digest % self.shard[1] != self.shard[0]:
+                        stats["other_shards"] += 1
+                        continue
+                    if self.keep is not None and not self.keep(address):
+                        continue
+                    stats["selected"] += 1
+                    yield address
+        finally:
+            seen.close()
+
+    def scan(self) -> Dict[str, int]:
+        # One full pass, for the counts
+        for _ in self:
+            pass
+        return self.stats
+
+    def summary(self) -> str:
+        s = self.stats
+        parts = [f"{s.get('selected', 0)} recipients"]
+        if self.shard is not None:
+            parts.append(f"shard {self.shard[0]}/{self.shard[1]} of {s.get('unique', 0)} unique")
+        if s.get("duplicates"):
+            parts.append(f"{s['duplicates']} duplicates dropped")
+        if s.get("invalid"):
+            parts.append(f"{s['invalid']} invalid dropped (e.g. {', '.join(repr(a) for a in self.invalid)})")
+        return ", ".join(parts)
+
+
+def iter_chunks(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from env import get_float
+from metrics import METRICS
+
+DEFAULT_SEND_AT = "06:00"
+
+# (market, run date) -> prepared message ({"subject", "html_body", ...})
+Prepare = Callable[[dict, str], dict]
+# (market, run date, prepared) -> a newer message, or None to keep the prepared one
+Refresh = Callable[[dict, str, dict], Optional[dict]]
+# (market, run date, message) -> recipients delivered
+Send = Callable[[dict, str, dict], int]
+# (market, run date, "ok"/"failed") after each send, once its span is recorded
+Report = Callable[[dict, str, str], None]
+
+
+def market_zone(market: dict) -> ZoneInfo:
+    name = market.get("timezone") or "UTC"
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {name!r} for market {market['name']!r}") from None
+
+
+def send_time(market: dict) -> dtime:
+    value = str(market.get("send_at") or DEFAULT_SEND_AT).strip()
+    try:
+        return dtime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"expected send_at as HH:MM, got {value!r} for market {market['name']!r}") from None
+
+
+def next_send(market: dict, now: float) -> datetime:
+    # The next send_at wall-clock time in the market's timezone strictly after `now`, so DST
+    # changes move the UTC instant and not the local delivery time
+    zone, at = market_zone(market), send_time(market)
+    local = datetime.fromtimestamp(now, zone)
+    candidate = datetime.combine(local.date(), at, tzinfo=zone)
+    if candidate.timestamp() <= now:
+        candidate = datetime.combine(local.date() + timedelta(days=1), at, tzinfo=zone)
+    return candidate
+
+
+class Scheduler:
+    # Runs any number of markets in one long-lived process. Ahead of each market's next local
+    # send time it prepares the email (SCHEDULER_PREPARE_MINUTES before, default 20: news fetch
+    # and generation), refreshes it once more shortly before (SCHEDULER_REFRESH_MINUTES, default
+    # 5, 0 disables) and delivers at the send instant from whichever message is ready. A refresh
+    # that has not finished by then is ignored, so late-breaking news never delays a send. Work
+    # runs on a thread pool, so one market's generation never holds up another market's send.
+
+    def __init__(
+        self,
+        markets: List[dict],
+        prepare: Prepare,
+        refresh: Refresh,
+        send: Send,
+        *,
+        once: bool = False,
+        report: Optional[Report] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        for market in markets:
+            market_zone(market)
+            send_time(market)
+        self.markets = markets
+        self.prepare = prepare
+        self.refresh = refresh
+        self.send = send
+        self.once = once
+        self.report = report
+        self.clock = clock
+        self.prepare_s = max(0.0, get_float("SCHEDULER_PREPARE_MINUTES", 20.0) * 60)
+        self.refresh_s = max(0.0, get_float("SCHEDULER_REFRESH_MINUTES", 5.0) * 60)
+        self.failed: List[str] = []
+        self._stop = threading.Event()
+        self._events: List[tuple] = []
+        self._seq = itertools.count()
+        self._slots: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(2, 2 * len(markets)), thread_name_prefix="scheduler")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _push(self, at: float, kind: str, market: dict) -> None:
+        heapq.heappush(self._events, (at, next(self._seq), kind, market))
+
+    def _plan(self, market: dict) -> None:
+        now = self.clock()
+        send_at = next_send(market, now)
+        slot = {"send_at": send_at, "day": send_at.strftime("%Y-%m-%d"), "prepared": None, "refreshed": None}
+        self._slots[market["name"]] = slot
+        send_ts = send_at.timestamp()
+        prepare_ts = max(now, send_ts - self.prepare_s)
+        self._push(prepare_ts, "prepare", market)
+        if self.refresh_s and send_ts - self.refresh_s > prepare_ts:
+            self._push(send_ts - self.refresh_s, "refresh", market)
+        self._push(send_ts, "send", market)
+        print(
+            f"[{market['name']}] Next send {send_at:%Y-%m-%d %H:%M %Z}, preparing from "
+            f"{datetime.fromtimestamp(prepare_ts, send_at.tzinfo):%H:%M:%S}"
+        )
+
+    def run(self) -> None:
+        for market in self.markets:
+            self._plan(market)
+        finished = False
+        try:
+            while not self._stop.is_set():
+                at, _, kind, market = self._events[0]
+                delay = at - self.clock()
+                if delay > 0:
+                    # Woken at least every minute, so a suspended machine or clock step is noticed
+                    self._stop.wait(min(delay, 60.0))
+                    continue
+                heapq.heappop(self._events)
+                slot = self._slots[market["name"]]
+                if kind == "prepare":
+                    slot["prepared"] = self._pool.submit(self._prepare, market, slot)
+                elif kind == "refresh":
+                    slot["refreshed"] = self._pool.submit(self._refresh, market, slot)
+                else:
+                    self._pool.submit(self._send, market, slot)
+                    if not self.once:
+                        self._plan(market)
+                    elif not any(event[2] == "send" for event in self._events):
+                        finished = True
+                        break
+        finally:
+            # When stopped early, in-flight work finishes and anything not started is dropped
+            self._pool.shutdown(wait=True, cancel_futures=not finished)
+
+    def _prepare(self, market: dict, slot: dict) -> dict:
+        with METRICS.span("prepare", market=market["name"]):
+            message = self.prepare(market, slot["day"])
+        lead = slot["send_at"].timestamp() - self.clock()
+        print(f"[{market['name']}] Prepared {lead:.0f}s before the send")
+        return message
+
+    def _refresh(self, market: dict, slot: dict) -> Optional[dict]:
+        try:
+            prepared = slot["prepared"].result()
+        except Exception:
+            # The send retries the preparation itself
+            return None
+        with METRICS.span("refresh", market=market["name"]):
+            return self.refresh(market, slot["day"], prepared)
+
+    def _ready(self, market: dict, slot: dict) -> dict:
+        # The refreshed message if it finished in time, else the prepared one (waiting for it
+        # if generation is running late), else a last-moment preparation
+        refreshed: Future | None = slot["refreshed"]
+        if refreshed is not None and refreshed.done() and refreshed.exception() is None and refreshed.result():
+            METRICS.incr("scheduler_refreshes_used", market=market["name"])
+            return refreshed.result()
+        if refreshed is not None and not refreshed.done():
+            print(f"[{market['name']}] Refresh still running at send time; sending the prepared message")
+        try:
+            return slot["prepared"].result()
+        except Exception as exc:
+            print(f"[{market['name']}] Preparation failed ({exc}); preparing again now")
+            return self.prepare(market, slot["day"])
+
+    def _send(self, market: dict, slot: dict) -> None:
+        name = market["name"]
+        status = "failed"
+        try:
+            message = self._ready(market, slot)
+            # How far past the scheduled instant delivery actually began
+            METRICS.observe("send_delay_seconds", max(0.0, self.clock() - slot["send_at"].timestamp()), market=name)
+            with METRICS.span("send", market=name):
+                sent = self.send(market, slot["day"], message)
+            print(f"[{name}] Sent {sent} emails for {slot['day']}")
+            status = "ok"
+        except (Exception, SystemExit) as exc:
+            with self._lock:
+                self.failed.append(name)
+            print(f"[{name}] failed: {exc}")
+        finally:
+            if self.report is not None:
+                self.report(market, slot["day"], status)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from smtp_delivery import DeliveryReport
+
+# SendGrid v3 /mail/send accepts at most 1000 personalizations per request
+MAX_PERSONALIZATIONS = 1000
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def chunked(items: Sequence[str], size: int) -> List[Sequence[str]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def build_payload(
+    *,
+    subject: str,
+    html_body: str,
+    text_body: str,
+    recipients: Sequence[str],
+    from_address: str,
+    from_name: str | None = None,
+    personalization: Optional[Callable[[str], dict]] = None,
+) -> dict:
+    # Each recipient gets their own personalization, so nobody sees the other addresses;
+    # `personalization` adds per-recipient fields such as substitutions or a subject
+    sender = {"email": from_address}
+    if from_name:
+        sender["name"] = from_name
+    return {
+        "from": sender,
+        "subject": subject,
+        "content": [
+            {"type": "text/plain", "value": text_body},
+            {"type": "text/html", "value": html_body},
+        ],
+        "personalizations": [
+            {"to": [{"email": addr}], **(personalization(addr) if personalization else {})} for addr in recipients
+        ],
+    }
+
+
+def _post_with_retry(
+    post: Callable[[dict], Tuple[int, dict, str]],
+    payload: dict,
+    *,
+    retries: int,
+    backoff: float,
+) -> Tuple[int, str, int]:
+    # Returns (status, body, attempts). Retries 429/5xx with exponential backoff + jitter,
+    # honouring Retry-After when the API sends one.
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            status, headers, body = post(payload)
+        except Exception as exc:
+            status = getattr(exc, "status_code", None)
+            if status is None:
+                if attempt > retries:
+                    return 0, f"{type(exc).__name__}: {exc}", attempt
+                time.sleep(backoff * 2 ** (attempt - 1))
+                continue
+            headers = dict(getattr(exc, "headers", None) or {})
+            body = getattr(exc, "body", b"")
+        if status not in RETRY_STATUSES or attempt > retries:
+            return status, body.decode("utf-8", "replace") if isinstance(body, bytes) else str(body), attempt
+        retry_after = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = backoff * 2 ** (attempt - 1)
+        time.sleep(delay + random.uniform(0, backoff))
+
+
+def deliver_bulk(
+    post: Callable[[dict], Tuple[int, dict, str]],
+    *,
+    subject: str,
+    html_body: str,
+    text_body: str,
+    recipients: Sequence[str],
+    from_address: str,
+    from_name: str | None = None,
+    chunk_size: int = MAX_PERSONALIZATIONS,
+    concurrency: int = 4,
+    retries: int = 4,
+    backoff: float = 1.0,
+    personalization: Optional[Callable[[str], dict]] = None,
+) -> DeliveryReport:
+    report = DeliveryReport()
+    chunks = chunked(list(recipients), max(1, min(chunk_size, MAX_PERSONALIZATIONS)))
+
+    def submit(chunk: Sequence[str]) -> None:
+        payload = build_payload(
+            subject=subject,
+            html_body=html_body,
+            text_body=text_body,
+            recipients=chunk,
+            from_address=from_address,
+            from_name=from_name,
+            personalization=personalization,
+        )
+        start = time.monotonic()
+        status, body, attempts = _post_with_retry(post, payload, retries=retries, backoff=backoff)
+        latency = time.monotonic() - start
+        if 200 <= status < 300:
+            for addr in chunk:
+                report.ok(addr, latency)
+        else:
+            error = f"HTTP {status} after {attempts} attempts: {body[:200]}"
+            for addr in chunk:
+                report.fail(addr, error)
+
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks))), thread_name_prefix="sendgrid") as pool:
+            list(pool.map(submit, chunks))
+    report.finished = time.monotonic()
+    return report
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Errors after which the connection is discarded and re-established before retrying
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, OSError)
+
+
+class RateLimiter:
+    # Token bucket shared by all workers; rate_per_minute <= 0 disables it.
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+class DeliveryReport:
+    def __init__(self) -> None:
+        self.sent: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.latencies: Dict[str, float] = {}
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self._lock = threading.Lock()
+
+    def ok(self, recipient: str, latency: float) -> None:
+        with self._lock:
+            self.sent.append(recipient)
+            self.latencies[recipient] = latency
+
+    def fail(self, recipient: str, error: str) -> None:
+        with self._lock:
+            self.failed[recipient] = error
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        return len(self.sent) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return f"{len(self.sent)} sent, {len(self.failed)} failed in {self.elapsed:.2f}s ({self.rate:.1f} msgs/sec)"
+
+
+class SmtpDeliveryEngine:
+    # Sends one message per recipient over `workers` persistent, authenticated SMTP
+    # connections. Each worker owns its connection, reconnects when it drops, and retries a
+    # recipient up to `retries` times before recording it as failed.
+
+    def __init__(
+        self,
+        *,
+        host: str,
+        port: int,
+        username: str | None,
+        password: str | None,
+        workers: int = 4,
+        rate_per_minute: float = 0,
+        starttls: bool = True,
+        retries: int = 2,
+        timeout: float = 30.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate_per_minute)
+        self.starttls = starttls
+        self.retries = retries
+        self.timeout = timeout
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return server
+
+    @staticmethod
+    def _close(server: Optional[smtplib.SMTP]) -> None:
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _worker(self, jobs: "queue.Queue[Optional[tuple]]", from_address: str, abort: threading.Event) -> None:
+        server: Optional[smtplib.SMTP] = None
+        try:
+            while True:
+                job = jobs.get()
+                if job is None:
+                    return
+                recipient, batch = job
+                if abort.is_set():
+                    batch.report.fail(recipient, "not attempted: SMTP authentication failed")
+                    batch.settle()
+                    continue
+                last_error = ""
+                delivered = False
+                for _ in range(self.retries + 1):
+                    try:
+                        if server is None:
+                            server = self._connect()
+                        self.limiter.acquire()
+                        start = time.monotonic()
+                        server.sendmail(from_address, [recipient], batch.render(recipient))
+                        batch.report.ok(recipient, time.monotonic() - start)
+                        delivered = True
+                        break
+                    except smtplib.SMTPAuthenticationError as exc:
+                        # Bad credentials will not improve by retrying every recipient
+                        last_error = f"SMTPAuthenticationError: {exc}"
+                        abort.set()
+                        break
+                    except ValueError as exc:
+                        # Rejected while rendering (malformed address); nothing was sent
+                        last_error = str(exc)
+                        break
+                    except smtplib.SMTPRecipientsRefused as exc:
+                        # Permanent for this address; the connection is still fine
+                        last_error = str(exc.recipients.get(recipient, exc))
+                        break
+                    except RECONNECT_ERRORS + (smtplib.SMTPException,) as exc:
+                        last_error = f"{type(exc).__name__}: {exc}"
+                        self._close(server)
+                        server = None
+                if not delivered:
+                    batch.report.fail(recipient, last_error)
+                batch.settle()
+        finally:
+            self._close(server)
+
+    def start(self, *, from_address: str) -> None:
+        # Starts the workers for a session of send() calls. Each worker connects on its first
+        # message and keeps that connection until close(), so batches after the first pay no
+        # new STARTTLS and login.
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._abort = threading.Event()
+        self._threads: List[threading.Thread] = [
+            threading.Thread(
+                target=self._worker,
+                args=(self._jobs, from_address, self._abort),
+                name=f"smtp-{i}",
+                daemon=True,
+            )
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def send(self, recipients: Iterable[str], render: Callable[[str], bytes]) -> DeliveryReport:
+        # Delivers one batch over the session's connections and waits for all of it
+        recipients = list(recipients)
+        batch = _Batch(render, len(recipients))
+        for recipient in recipients:
+            self._jobs.put((recipient, batch))
+        batch.done.wait()
+        batch.report.finished = time.monotonic()
+        return batch.report
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._jobs.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def deliver(
+        self,
+        recipients: Iterable[str],
+        *,
+        from_address: str,
+        render: Callable[[str], bytes],
+    ) -> DeliveryReport:
+        # A one-batch session
+        self.start(from_address=from_address)
+        try:
+            return self.send(recipients, render)
+        finally:
+            self.close()
+
+
+class _Batch:
+    # One send() call's recipients, done once every one of them has been reported
+
+    def __init__(self, render: Callable[[str], bytes], count: int) -> None:
+        self.render = render
+        self.report = DeliveryReport()
+        self.done = threading.Event()
+        self._left = count
+        self._lock = threading.Lock()
+        if not count:
+            self.done.set()
+
+    def settle(self) -> None:
+        with self._lock:
+            self._left -= 1
+            if self._left == 0:
+                self.done.set()
+
+
+def failed_summary(failed: Dict[str, str], limit: int = 5) -> str:
+    items: List[Tuple[str, str]] = sorted(failed.items())[:limit]
+    more = f" (+{len(failed) - limit} more)" if len(failed) > limit else ""
+    return "; ".join(f"{addr}: {err}" for addr, err in items) + more
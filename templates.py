@@ -33,6 +33,25 @@ PROMPT_INDIA_BODY = (
     "Top 3–5 sectors or specific NSE/BSE tickers likely to be most affected today"
 )
 
+# Map-reduce generation: the news feed categories (news_fetcher) each prompt category reads.
+# A category listed with no feeds gets no news section; a category not listed at all (e.g.
+# from a custom prompt_body) gets the whole news context.
+PROMPT_CATEGORY_FEEDS = {
+    "Political News": ["Political News"],
+    "World News": ["World News"],
+    "U.S. News": ["U.S. News"],
+    "Technology News": ["Technology News"],
+    "Trending Infrastructure & Energy News": ["Trending Infrastructure & Energy News"],
+    "Market-Relevant Trends": ["Market-Relevant Trends"],
+    "Political News (India)": ["Political News"],
+    "World News Relevant to India": ["World News"],
+    # No India-specific economy feed: "Indian Economy & Domestic News" is left unmapped so it
+    # sees everything rather than the U.S. economy feed
+    "Technology & Startup News (India)": ["Technology News"],
+    "Infrastructure, Energy & Manufacturing News": ["Trending Infrastructure & Energy News"],
+    "Sector-Specific Corporate News": ["Market-Relevant Trends"],
+}
+
 SYSTEM_INSTRUCTIONS_BASE = (
     "You are a precise financial research assistant. If no external context is provided, use your internal knowledge to provide concrete, non-placeholder insights for every category.\n"
     "Do not wrap the response in Markdown or code fences of any kind. Output direct HTML only.\n"
@@ -59,9 +78,38 @@ PROMPT_TEMPLATE = (
     "</task>\n"
 )
 
+# Map-reduce generation (map_reduce.py): one prompt per category, then a short closing pass
+CATEGORY_PROMPT_TEMPLATE = (
+    "<context>\n"
+    "{news_context}\n"
+    "</context>\n\n"
+    "<task>\n"
+    "{intro}\n\n"
+    "Cover only this one category; other sections of the email are written separately:\n\n"
+    "{category} – {description}\n\n"
+    "Provide:\n\n"
+    "{instructions}\n"
+    "Output strictly as an HTML fragment: an <h2> with the category name followed by its content. "
+    "Do not add an introduction or an overall sentiment section.\n"
+    "</task>\n"
+)
 
-def build_email_subject(subject_prefix: str | None = None) -> str:
-    today = datetime.now().strftime("%Y-%m-%d")
+MERGE_PROMPT_TEMPLATE = (
+    "<sections>\n"
+    "{sections}\n"
+    "</sections>\n\n"
+    "<task>\n"
+    "Current date: {current_date}\n\n"
+    "The sections above are today's per-category market summaries. Write only the closing section of the email:\n\n"
+    "{closing}\n"
+    "Output strictly as an HTML fragment starting with <h2>Overall Market Sentiment</h2>. "
+    "Do not repeat the category summaries.\n"
+    "</task>\n"
+)
+
+
+def build_email_subject(subject_prefix: str | None = None, today: str | None = None) -> str:
+    today = today or datetime.now().strftime("%Y-%m-%d")
     if subject_prefix:
         return f"{subject_prefix} — {today}"
     return f"Market Daily TL;DR — {today}"
@@ -78,15 +126,27 @@ def get_system_instructions(focus_market: str | None) -> str:
     return SYSTEM_INSTRUCTIONS_BASE
 
 
-def build_user_prompt(news_context: str, focus_market: str | None) -> str:
+def get_prompt_body(focus_market: str | None, prompt_body: str | None = None) -> str:
+    if prompt_body:
+        return prompt_body
+    if "india" in (focus_market or "").lower():
+        return PROMPT_INDIA_BODY
+    return PROMPT_USA_BODY
+
+
+def _current_date(today: str | None = None) -> str:
+    # `today` is a YYYY-MM-DD run date (e.g. the market's local date); the host's date otherwise
+    day = datetime.strptime(today, "%Y-%m-%d") if today else datetime.now()
+    return day.strftime("%A, %B %d, %Y")
+
+
+def build_user_prompt(
+    news_context: str, focus_market: str | None, prompt_body: str | None = None, today: str | None = None
+) -> str:
     # Get current date to provide context for "today"
-    current_date = datetime.now().strftime("%A, %B %d, %Y")
+    current_date = _current_date(today)
     
-    fm = (focus_market or "").lower()
-    if "india" in fm:
-        body = PROMPT_INDIA_BODY
-    else:
-        body = PROMPT_USA_BODY
+    body = get_prompt_body(focus_market, prompt_body)
     
     # Add current date context at the beginning of the prompt
     date_context = f"Current date: {current_date}\n\n"
@@ -97,6 +157,24 @@ def build_user_prompt(news_context: str, focus_market: str | None) -> str:
     )
 
 
+def build_category_prompt(
+    news_context: str, intro: str, category: str, description: str, instructions: str, today: str | None = None
+) -> str:
+    current_date = _current_date(today)
+    return CATEGORY_PROMPT_TEMPLATE.format(
+        news_context=f"Current date: {current_date}\n\n" + (news_context or ""),
+        intro=intro,
+        category=category,
+        description=description,
+        instructions=instructions,
+    )
+
+
+def build_merge_prompt(sections: str, closing: str, today: str | None = None) -> str:
+    current_date = _current_date(today)
+    return MERGE_PROMPT_TEMPLATE.format(sections=sections, current_date=current_date, closing=closing)
+
+
 EMAIL_HTML_SHELL = """
 <!doctype html>
 <html>
@@ -110,13 +188,28 @@ EMAIL_HTML_SHELL = """
       <div style=\"background:#ffffff; border-radius:10px; padding:24px; box-shadow:0 1px 3px rgba(0,0,0,0.06);\">
         <h1 style=\"margin:0 0 12px; font-size:20px;\">{subject}</h1>
         <div style=\"font-size:14px; color:#666; margin-bottom:16px;\">Generated {generated_at}</div>
+        <p style=\"margin:0 0 16px;\">{greeting_html}</p>
+        {watchlist_html}
         <div>{content_html}</div>
         <hr style=\"border:none; border-top:1px solid #eee; margin:24px 0;\" />
         <div style=\"font-size:12px; color:#888;\">
           You are receiving this email because you subscribed to Market Daily TL;DR.\n
+          {unsubscribe_html}
         </div>
       </div>
     </div>
   </body>
 </html>
-""" 
\ No newline at end of file
+""" 
+
+# Plain-text counterpart of EMAIL_HTML_SHELL for personalized sends (personalize.py)
+EMAIL_TEXT_SHELL = """{subject}
+Generated {generated_at}
+
+{greeting_text}
+
+{watchlist_text}{content_text}
+
+--
+You are receiving this email because you subscribed to Market Daily TL;DR.
+{unsubscribe_text}"""
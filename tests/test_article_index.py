@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from article_index import canonicalize_url  # noqa: E402
+
+CANONICAL = "https://bbc.co.uk/news/world-123"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.bbc.co.uk/news/world-123",
+        "http://bbc.co.uk/news/world-123/",
+        "https://www.bbc.co.uk/news/amp/world-123",
+        "https://www.bbc.co.uk/amp/news/world-123",
+        "https://www.bbc.co.uk/news/world-123/amp",
+        "https://amp.bbc.co.uk/news/world-123.amp",
+        "https://www.bbc.co.uk/news/world-123?utm_source=rss&at_medium=x&amp=1",
+    ],
+)
+def test_variants_share_one_key(url):
+    assert canonicalize_url(url) == CANONICAL
+
+
+def test_amp_inside_a_segment_is_kept():
+    assert canonicalize_url("https://example.com/news/ampere-results") == "https://example.com/news/ampere-results"
+    assert canonicalize_url("https://example.com/news/camp/x") == "https://example.com/news/camp/x"
+
+
+def test_amp_only_path_is_the_root():
+    assert canonicalize_url("https://example.com/amp/") == "https://example.com/"
+
+
+def test_other_query_parameters_are_kept_sorted():
+    assert canonicalize_url("https://example.com/a?b=2&a=1&fbclid=x") == "https://example.com/a?a=1&b=2"